@@ -0,0 +1,189 @@
+"""
+Admission control for routes that run model inference.
+
+Each limited route belongs to a priority class ('public' or 'user'). Before a
+request runs it must take a token from its client's bucket (keyed by route
+and client IP) and from the route's shared bucket; otherwise it is rejected
+with 429 and a Retry-After hint. Model work itself is capped per class by a
+non-blocking in-flight semaphore, and public requests get only part of the
+ML capacity, so anonymous traffic is shed first and authenticated users
+keep the rest.
+"""
+import math
+import threading
+import time
+from collections import OrderedDict
+
+MAX_TRACKED_CLIENTS = 50000
+
+
+class RateLimited(Exception):
+    """Raised when a request exceeds its client or route rate limit"""
+
+    def __init__(self, scope, retry_after):
+        super().__init__(scope)
+        self.scope = scope
+        self.retry_after = retry_after
+
+
+class TokenBucket:
+    """Refills at rate tokens per second up to burst; not thread-safe on its own"""
+
+    __slots__ = ('rate', 'burst', 'tokens', 'updated')
+
+    def __init__(self, rate, burst, now):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = now
+
+    def take(self, now):
+        """Take one token; returns 0 on success or the seconds until one is available"""
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0
+        return (1 - self.tokens) / self.rate
+
+
+class RateLimiter:
+    """Token buckets per key; the least recently seen keys are evicted past max_keys"""
+
+    def __init__(self, rate, burst, max_keys=MAX_TRACKED_CLIENTS):
+        self.rate = float(rate)
+        self.burst = max(1.0, float(burst))
+        self.max_keys = max_keys
+        self.buckets = OrderedDict()
+        self.lock = threading.Lock()
+
+    @property
+    def enabled(self):
+        return self.rate > 0
+
+    def check(self, key):
+        """0 if key may proceed, else seconds to wait"""
+        if not self.enabled:
+            return 0
+        now = time.monotonic()
+        with self.lock:
+            bucket = self.buckets.get(key)
+            if bucket is None:
+                bucket = self.buckets[key] = TokenBucket(self.rate, self.burst, now)
+                if len(self.buckets) > self.max_keys:
+                    # An evicted bucket has been idle longest and would be
+                    # (nearly) full again, so forgetting it loses little
+                    self.buckets.popitem(last=False)
+            else:
+                self.buckets.move_to_end(key)
+            return bucket.take(now)
+
+    def tracked(self):
+        with self.lock:
+            return len(self.buckets)
+
+
+class AdmissionClass:
+    """Limits for one priority class of routes"""
+
+    def __init__(self, client_rate, client_burst, route_rate, route_burst, max_inflight):
+        self.client_rate = client_rate
+        self.client_burst = client_burst
+        self.route_rate = route_rate
+        self.route_burst = route_burst
+        self.max_inflight = max(1, int(max_inflight))
+
+
+class AdmissionController:
+    """Rate limits, in-flight caps and admit / reject counters per route"""
+
+    def __init__(self, classes, routes):
+        # classes: name -> AdmissionClass; routes: endpoint -> class name
+        self.classes = classes
+        self.routes = dict(routes)
+        self.client_limiters = {
+            name: RateLimiter(cls.client_rate, cls.client_burst) for name, cls in classes.items()
+        }
+        self.route_limiters = {
+            endpoint: RateLimiter(classes[name].route_rate, classes[name].route_burst, max_keys=1)
+            for endpoint, name in self.routes.items()
+        }
+        self.inflight_slots = {
+            name: threading.BoundedSemaphore(cls.max_inflight) for name, cls in classes.items()
+        }
+        self.inflight = {name: 0 for name in classes}
+        self.counters = {
+            endpoint: {'admitted': 0, 'rejected_client_rate': 0, 'rejected_route_rate': 0, 'shed_inflight': 0}
+            for endpoint in self.routes
+        }
+        self.lock = threading.Lock()
+
+    def priority(self, endpoint):
+        """Priority class of an endpoint, or None if it is not admission controlled"""
+        return self.routes.get(endpoint)
+
+    def _count(self, endpoint, counter):
+        with self.lock:
+            self.counters[endpoint][counter] += 1
+
+    def admit(self, endpoint, client):
+        """Apply the client and route rate limits; raises RateLimited when over either"""
+        name = self.routes.get(endpoint)
+        if name is None:
+            return
+        wait = self.client_limiters[name].check((endpoint, client))
+        if wait:
+            self._count(endpoint, 'rejected_client_rate')
+            raise RateLimited('client', retry_after_seconds(wait))
+        wait = self.route_limiters[endpoint].check(endpoint)
+        if wait:
+            self._count(endpoint, 'rejected_route_rate')
+            raise RateLimited('route', retry_after_seconds(wait))
+        self._count(endpoint, 'admitted')
+
+    def acquire(self, name):
+        """Take an in-flight slot for class name without blocking; returns False when full"""
+        if not self.inflight_slots[name].acquire(blocking=False):
+            return False
+        with self.lock:
+            self.inflight[name] += 1
+        return True
+
+    def release(self, name):
+        with self.lock:
+            self.inflight[name] -= 1
+        self.inflight_slots[name].release()
+
+    def shed(self, endpoint):
+        """Record a request whose model work was rejected for lack of capacity"""
+        if endpoint in self.counters:
+            self._count(endpoint, 'shed_inflight')
+
+    def stats(self):
+        """Counters and current limits for monitoring"""
+        with self.lock:
+            counters = {endpoint: dict(values) for endpoint, values in self.counters.items()}
+            inflight = dict(self.inflight)
+        return {
+            'routes': {
+                endpoint: {'priority': self.routes[endpoint], **values}
+                for endpoint, values in counters.items()
+            },
+            'classes': {
+                name: {
+                    'inflight': inflight[name],
+                    'max_inflight': cls.max_inflight,
+                    'client_rate': cls.client_rate,
+                    'client_burst': cls.client_burst,
+                    'route_rate': cls.route_rate,
+                    'route_burst': cls.route_burst,
+                    'tracked_clients': self.client_limiters[name].tracked()
+                }
+                for name, cls in self.classes.items()
+            }
+        }
+
+
+def retry_after_seconds(wait):
+    """Whole seconds for a Retry-After header (at least 1)"""
+    return max(1, math.ceil(wait))
@@ -0,0 +1,121 @@
+"""
+Response helpers for the JSON API: a faster JSON provider, negotiated
+gzip/brotli compression and conditional GET (ETag / Last-Modified) checks.
+
+orjson and brotli are optional; without them the stdlib json encoder and
+gzip-only compression are used.
+"""
+import gzip
+
+from flask import Response, request
+from flask.json.provider import DefaultJSONProvider
+from werkzeug.http import is_resource_modified
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+COMPRESS_MIN_BYTES = 1024
+COMPRESSIBLE_MIMETYPES = ('application/json',)
+# Static files negotiate their own (precompressed) encoding and validators
+COMPRESS_PATH_PREFIX = '/api/'
+
+
+class FastJSONProvider(DefaultJSONProvider):
+    """Compact JSON encoding, using orjson when it is installed"""
+    sort_keys = False
+    compact = True
+
+    if orjson is not None:
+        _orjson_options = orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS
+
+        def dumps(self, obj, **kwargs):
+            if kwargs:
+                return super().dumps(obj, **kwargs)
+            return orjson.dumps(obj, default=self.default, option=self._orjson_options).decode()
+
+        def loads(self, s, **kwargs):
+            if kwargs:
+                return super().loads(s, **kwargs)
+            return orjson.loads(s)
+
+        def response(self, *args, **kwargs):
+            obj = self._prepare_response_obj(args, kwargs)
+            return self._app.response_class(
+                orjson.dumps(obj, default=self.default, option=self._orjson_options),
+                mimetype=self.mimetype
+            )
+
+
+def _accepted_encoding(accept_encodings):
+    if brotli is not None and accept_encodings['br']:
+        return 'br'
+    if accept_encodings['gzip']:
+        return 'gzip'
+    return None
+
+
+def compress_response(response, min_bytes=COMPRESS_MIN_BYTES):
+    """after_request hook: compress API JSON bodies above min_bytes for clients that accept it"""
+    if (not request.path.startswith(COMPRESS_PATH_PREFIX)
+            or response.direct_passthrough or response.is_streamed
+            or response.status_code < 200 or response.status_code in (204, 304)
+            or 'Content-Encoding' in response.headers
+            or response.mimetype not in COMPRESSIBLE_MIMETYPES):
+        return response
+
+    response.vary.add('Accept-Encoding')
+    data = response.get_data()
+    if len(data) < min_bytes:
+        return response
+
+    encoding = _accepted_encoding(request.accept_encodings)
+    if encoding is None:
+        return response
+
+    if encoding == 'br':
+        compressed = brotli.compress(data, quality=5)
+    else:
+        compressed = gzip.compress(data, compresslevel=6)
+
+    response.set_data(compressed)
+    response.headers['Content-Encoding'] = encoding
+    # Validators describe the uncompressed representation
+    if response.headers.get('ETag'):
+        etag, weak = response.get_etag()
+        response.set_etag(f'{etag}-{encoding}', weak=weak)
+    return response
+
+
+def not_modified(etag, last_modified=None):
+    """
+    Return a 304 response when the client's cached copy matches etag /
+    last_modified, otherwise None so the caller builds the full response.
+    """
+    if not is_resource_modified(request.environ, etag=etag, last_modified=last_modified):
+        response = Response(status=304)
+        set_validators(response, etag, last_modified)
+        return response
+    # Compressed responses carry an encoding suffix on their ETag
+    for encoding in ('br', 'gzip'):
+        if request.if_none_match.contains(f'{etag}-{encoding}'):
+            response = Response(status=304)
+            set_validators(response, etag, last_modified)
+            response.set_etag(f'{etag}-{encoding}')
+            return response
+    return None
+
+
+def set_validators(response, etag, last_modified=None):
+    """Attach ETag / Last-Modified and require clients to revalidate"""
+    response.set_etag(etag)
+    if last_modified is not None:
+        response.last_modified = last_modified
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
@@ -1,19 +1,37 @@
-from flask import Flask, request, jsonify
-from datetime import datetime, timedelta
+import time
+IMPORT_STARTED = time.perf_counter()
+
+from flask import Flask, request, jsonify, redirect
+from datetime import datetime, timedelta, timezone
 import json
+import hmac
 import random
 import os
 import math
 import pickle
-import numpy as np
+import threading
+import itertools
+import uuid
+from urllib.parse import quote
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
 from flask_cors import CORS
-from sklearn.ensemble import RandomForestClassifier
-from sklearn.model_selection import train_test_split
-from sklearn.preprocessing import StandardScaler
-from sklearn.metrics import accuracy_score, classification_report
-import pandas as pd
+from micro_batcher import MicroBatcher
+from static_assets import StaticAssets
+from user_indexes import UserIndexes
+from soil_history import SoilHistoryStore, SOIL_PARAMETERS, RESOLUTIONS
+from event_stream import EventHub, shared_secret
+from feature_stats import FeatureMonitor, WorkerStatsStore
+from admission import AdmissionClass, AdmissionController, RateLimited
+from training_set import TrainingSet, sample_key, is_protected
+from similar_farms import SimilarFarmIndex, sample_profile, user_profile, summarize, FEATURES as FARM_FEATURES
+from api_responses import FastJSONProvider, compress_response, not_modified, set_validators
+
+# pandas / scikit-learn are imported lazily (see ensure_model_loaded) so
+# workers that only serve signup, user or static routes start quickly
 
 app = Flask(__name__)
+app.json = FastJSONProvider(app)
+app.after_request(compress_response)
 CORS(app)
 
 # File paths for data storage (use absolute paths relative to this script)
@@ -22,9 +40,84 @@ DATA_DIR = os.path.join(BACKEND_DIR, 'data')
 USERS_FILE = os.path.join(DATA_DIR, 'users.json')
 EMAILS_FILE = os.path.join(DATA_DIR, 'emails.txt')
 AI_TRAINING_FILE = os.path.join(DATA_DIR, 'ai_training_data.json')
+AI_TRAINING_STATE_FILE = os.path.join(DATA_DIR, 'ai_training_state.json')
 AI_MODEL_FILE = os.path.join(DATA_DIR, 'ai_model.pkl')
 AI_SCALER_FILE = os.path.join(DATA_DIR, 'ai_scaler.pkl')
 MODEL_ACCURACY_FILE = os.path.join(DATA_DIR, 'model_accuracy.txt')
+AI_FEATURE_STATS_FILE = os.path.join(DATA_DIR, 'ai_feature_stats.json')
+FEATURE_STATS_DIR = os.path.join(DATA_DIR, 'feature_stats')
+USER_INDEX_FILE = os.path.join(DATA_DIR, 'user_indexes.json')
+SOIL_HISTORY_DIR = os.path.join(DATA_DIR, 'soil_history')
+DIST_DIR = os.path.normpath(os.path.join(BACKEND_DIR, '..', 'dist'))
+
+MODEL_FEATURES = ['moisture', 'ph', 'nitrogen', 'phosphorus', 'potassium']
+
+# Unprotected (synthetic / sensor) training samples kept across all crops;
+# real_data and manual samples are always kept on top of this
+AI_TRAINING_RESERVOIR_SIZE = int(os.environ.get('AI_TRAINING_RESERVOIR_SIZE', 6000))
+
+# "Similar farms" KD-tree: pending changes are compacted into a new tree in
+# the background once there are this many of them
+SIMILAR_FARMS_REBUILD_CHANGES = int(os.environ.get('SIMILAR_FARMS_REBUILD_CHANGES', 2000))
+SIMILAR_FARMS_MAX_K = int(os.environ.get('SIMILAR_FARMS_MAX_K', 100))
+
+# Compact model mode (POST /api/ai/train with {"compact": true}, or on by
+# default with AI_COMPACT_MODEL=1): a depth/leaf-limited forest stored as
+# float32 thresholds and uint8 leaf distributions within a byte budget
+AI_COMPACT_MODEL = os.environ.get('AI_COMPACT_MODEL', '0') == '1'
+AI_COMPACT_MAX_BYTES = int(os.environ.get('AI_COMPACT_MAX_BYTES', 256 * 1024))
+AI_COMPACT_N_ESTIMATORS = int(os.environ.get('AI_COMPACT_N_ESTIMATORS', 50))
+AI_COMPACT_MAX_DEPTH = int(os.environ.get('AI_COMPACT_MAX_DEPTH', 12))
+AI_COMPACT_MAX_LEAF_NODES = int(os.environ.get('AI_COMPACT_MAX_LEAF_NODES', 64))
+
+# CPU-bound model work is offloaded to bounded worker pools so that slow
+# predictions and training runs never tie up the request threads serving
+# fast endpoints such as /api/health and /api/user/<email>
+ML_WORKERS = int(os.environ.get('ML_WORKERS', 2))
+ML_MAX_QUEUE = int(os.environ.get('ML_MAX_QUEUE', 16))
+ML_TIMEOUT_SECONDS = float(os.environ.get('ML_TIMEOUT_SECONDS', 10))
+TRAIN_TIMEOUT_SECONDS = float(os.environ.get('TRAIN_TIMEOUT_SECONDS', 300))
+
+# Concurrent single-sample predictions are coalesced into one vectorized call;
+# raise these to trade per-request latency for throughput
+ML_BATCH_MAX_SIZE = int(os.environ.get('ML_BATCH_MAX_SIZE', 32))
+ML_BATCH_MAX_WAIT_MS = float(os.environ.get('ML_BATCH_MAX_WAIT_MS', 5))
+
+# Load the ML stack and saved model in a background thread at startup;
+# with ML_WARMUP=0 they are loaded by the first request that needs them
+ML_WARMUP = os.environ.get('ML_WARMUP', '1') != '0'
+
+# Server-Sent Events for recommendation updates are served by a separate
+# asyncio listener, owned by the first worker process to bind SSE_PORT
+# (other workers forward their events to it); SSE_PUBLIC_URL overrides the
+# URL clients are sent to and SSE_ENABLED=0 turns the listener off.
+# Forwarded events are authenticated with SSE_INTERNAL_TOKEN, or by default
+# with a random secret the workers share through DATA_DIR
+SSE_HOST = os.environ.get('SSE_HOST', '0.0.0.0')
+SSE_PORT = int(os.environ.get('SSE_PORT', 5001))
+SSE_PUBLIC_URL = os.environ.get('SSE_PUBLIC_URL')
+SSE_ENABLED = os.environ.get('SSE_ENABLED', '1') != '0'
+SSE_INTERNAL_TOKEN = os.environ.get('SSE_INTERNAL_TOKEN')
+
+# Admission control for inference routes: token-bucket rates are requests per
+# second (0 disables a limit); the public prediction route may use only
+# ML_PUBLIC_MAX_INFLIGHT of the prediction pool's slots so anonymous traffic
+# is shed before it can crowd out signed-in users
+ADMISSION_PUBLIC_CLIENT_RATE = float(os.environ.get('ADMISSION_PUBLIC_CLIENT_RATE', 2))
+ADMISSION_PUBLIC_CLIENT_BURST = float(os.environ.get('ADMISSION_PUBLIC_CLIENT_BURST', 10))
+ADMISSION_PUBLIC_ROUTE_RATE = float(os.environ.get('ADMISSION_PUBLIC_ROUTE_RATE', 50))
+ADMISSION_PUBLIC_ROUTE_BURST = float(os.environ.get('ADMISSION_PUBLIC_ROUTE_BURST', 100))
+ADMISSION_USER_CLIENT_RATE = float(os.environ.get('ADMISSION_USER_CLIENT_RATE', 10))
+ADMISSION_USER_CLIENT_BURST = float(os.environ.get('ADMISSION_USER_CLIENT_BURST', 40))
+ADMISSION_USER_ROUTE_RATE = float(os.environ.get('ADMISSION_USER_ROUTE_RATE', 0))
+ADMISSION_USER_ROUTE_BURST = float(os.environ.get('ADMISSION_USER_ROUTE_BURST', 0))
+ML_PUBLIC_MAX_INFLIGHT = int(os.environ.get('ML_PUBLIC_MAX_INFLIGHT', max(1, (ML_WORKERS + ML_MAX_QUEUE) // 2)))
+# Number of trusted proxies in front of the app; the client address is the
+# X-Forwarded-For entry the outermost of them appended (0 uses the socket peer)
+ADMISSION_TRUST_PROXY = max(0, int(os.environ.get('ADMISSION_TRUST_PROXY', 0)))
+
+# Bearer token for the /api/admin/ routes; they are disabled when unset
+ADMIN_TOKEN = os.environ.get('ADMIN_TOKEN')
 
 # Ensure data directory exists
 os.makedirs(DATA_DIR, exist_ok=True)
@@ -42,9 +135,10 @@ def load_users():
     return {}
 
 def save_users(users_data):
-    """Save users to JSON file"""
+    """Save users to JSON file, along with the secondary indexes describing it"""
     with open(USERS_FILE, 'w') as f:
         json.dump(users_data, f, indent=2)
+    user_indexes.save(USER_INDEX_FILE, USERS_FILE)
 
 def load_emails():
     """Load emails from text file"""
@@ -68,10 +162,22 @@ def load_ai_training_data():
             return []
     return []
 
-def save_ai_training_data(training_data):
-    """Save AI training data to JSON file"""
+def load_ai_training_state():
+    """Load the training set's reservoir sampling state"""
+    if os.path.exists(AI_TRAINING_STATE_FILE):
+        try:
+            with open(AI_TRAINING_STATE_FILE, 'r') as f:
+                return json.load(f)
+        except:
+            return None
+    return None
+
+def save_ai_training_data(training_set):
+    """Save AI training data and its sampling state to JSON files"""
     with open(AI_TRAINING_FILE, 'w') as f:
-        json.dump(training_data, f, indent=2)
+        json.dump(training_set.snapshot(), f, indent=2)
+    with open(AI_TRAINING_STATE_FILE, 'w') as f:
+        json.dump(training_set.to_state(), f, indent=2)
 
 def load_ai_model():
     """Load AI model and scaler from pickle files"""
@@ -102,8 +208,22 @@ def load_ai_model():
     
     return model, scaler, accuracy
 
-def save_ai_model(model, scaler, accuracy):
-    """Save AI model and scaler to pickle files"""
+def load_feature_snapshot():
+    """Load the training-time feature statistics saved with the model"""
+    if os.path.exists(AI_FEATURE_STATS_FILE):
+        try:
+            with open(AI_FEATURE_STATS_FILE, 'r') as f:
+                return FeatureMonitor.from_dict(json.load(f))
+        except:
+            pass
+    return None
+
+def save_ai_model(model, scaler, accuracy, feature_stats=None):
+    """Save AI model and scaler to pickle files, plus training feature statistics"""
+    if feature_stats is not None:
+        with open(AI_FEATURE_STATS_FILE, 'w') as f:
+            json.dump(feature_stats.to_dict(), f)
+    
     if model is not None:
         with open(AI_MODEL_FILE, 'wb') as f:
             pickle.dump(model, f)
@@ -115,10 +235,208 @@ def save_ai_model(model, scaler, accuracy):
     with open(MODEL_ACCURACY_FILE, 'w') as f:
         f.write(str(accuracy))
 
-# Load data on startup
+def http_now():
+    """Current UTC time at the one-second resolution of HTTP dates"""
+    return datetime.now(timezone.utc).replace(microsecond=0)
+
+# Load data on startup; the model itself is loaded by ensure_model_loaded
 users = load_users()
-ai_training_data = load_ai_training_data()
-ai_model, model_scaler, model_accuracy = load_ai_model()
+user_indexes = UserIndexes()
+user_indexes.load(USER_INDEX_FILE, USERS_FILE, users)
+soil_history = SoilHistoryStore(SOIL_HISTORY_DIR)
+ai_model, model_scaler, model_accuracy = None, None, 0.0
+
+# Version counters backing ETag / Last-Modified on cacheable GET endpoints.
+# Versions come from one process-wide counter and are prefixed with the boot
+# time, so an ETag is never reused for different content.
+STARTUP_TIME = http_now()
+ETAG_EPOCH = format(int(STARTUP_TIME.timestamp()), 'x')
+version_counter = itertools.count(1)
+user_versions = {}
+model_version = next(version_counter)
+model_modified = STARTUP_TIME
+training_data_version = next(version_counter)
+training_data_modified = STARTUP_TIME
+
+def user_version(email):
+    """
+    Version state for a user: 'version' changes on any mutation, while
+    'inputs_version' only changes when data feeding recommendations changes
+    """
+    return user_versions.setdefault(email, {
+        'version': 0, 'modified': STARTUP_TIME,
+        'inputs_version': 0, 'inputs_modified': STARTUP_TIME
+    })
+
+def index_user(email, user=None):
+    """
+    Sync the secondary user indexes after a user was created, changed or
+    deleted; pass user to index a new version before it replaces users[email]
+    """
+    user = user if user is not None else users.get(email)
+    if user is not None:
+        user_indexes.update(email, user)
+        profile = user_profile(email, user)
+        if profile is not None:
+            similar_farms.upsert(profile)
+            return
+    else:
+        user_indexes.remove(email)
+    similar_farms.remove(f'user:{email}')
+
+def touch_user(email, inputs_changed=True):
+    """Bump a user's version counters after a mutation"""
+    state = user_version(email)
+    state['version'] = next(version_counter)
+    state['modified'] = http_now()
+    if inputs_changed:
+        state['inputs_version'] = state['version']
+        state['inputs_modified'] = state['modified']
+
+def touch_model(modified=None):
+    """Bump the model version after a new model is swapped in"""
+    global model_version, model_modified
+    model_version = next(version_counter)
+    model_modified = modified or http_now()
+
+def touch_training_data():
+    """Bump the training data version after samples are added"""
+    global training_data_version, training_data_modified
+    training_data_version = next(version_counter)
+    training_data_modified = http_now()
+
+startup_timings = {}
+model_ready = threading.Event()
+model_load_lock = threading.Lock()
+
+def ensure_model_loaded():
+    """
+    Import pandas / scikit-learn and load the saved model, once per process.
+    Runs on the warm-up thread at startup; ML code paths call it too and
+    block until loading has finished.
+    """
+    global ai_model, model_scaler, model_accuracy
+    if model_ready.is_set():
+        return
+    with model_load_lock:
+        if model_ready.is_set():
+            return
+        started = time.perf_counter()
+        import pandas
+        import sklearn.ensemble
+        startup_timings['ml_import_seconds'] = round(time.perf_counter() - started, 4)
+        
+        model, scaler, accuracy = load_ai_model()
+        if model is not None and scaler is not None:
+            ai_model, model_scaler, model_accuracy = model, scaler, accuracy
+            touch_model(datetime.fromtimestamp(int(os.path.getmtime(AI_MODEL_FILE)), timezone.utc))
+            set_training_feature_stats(load_feature_snapshot(), reset_live=False)
+        startup_timings['model_load_seconds'] = round(time.perf_counter() - started, 4)
+        model_ready.set()
+
+# Streaming statistics of model inputs, compared against the snapshot taken
+# from the training data; each worker process shares its own via a file
+training_feature_stats = None
+live_feature_stats = FeatureMonitor(MODEL_FEATURES)
+worker_feature_stats = WorkerStatsStore(FEATURE_STATS_DIR)
+
+def set_training_feature_stats(snapshot, reset_live=True):
+    """Use a new training snapshot as the drift reference"""
+    global training_feature_stats, live_feature_stats
+    training_feature_stats = snapshot
+    snapshot_id = snapshot.snapshot_id if snapshot is not None else None
+    if reset_live:
+        live_feature_stats = FeatureMonitor(MODEL_FEATURES, snapshot_id)
+        worker_feature_stats.reset()
+    else:
+        live_feature_stats.snapshot_id = snapshot_id
+
+def record_feature_stats(record, label=None):
+    """Add one model input (and its crop label, if known) to the live statistics"""
+    monitor = live_feature_stats
+    monitor.update(record, label)
+    try:
+        worker_feature_stats.maybe_flush(monitor)
+    except OSError as e:
+        # Monitoring must never fail the request it observes
+        print(f"Feature stats flush failed: {e}")
+
+class MLOverloaded(Exception):
+    """Raised when the ML worker pool and its queue are full"""
+
+class MLTimeout(Exception):
+    """Raised when an ML task does not finish within its deadline"""
+
+# Prediction pool: workers plus a bounded number of queued tasks
+ml_executor = ThreadPoolExecutor(max_workers=ML_WORKERS, thread_name_prefix='ml-predict')
+ml_slots = threading.BoundedSemaphore(ML_WORKERS + ML_MAX_QUEUE)
+
+# Training gets its own single worker so a retrain never blocks predictions
+train_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='ml-train')
+train_slots = threading.BoundedSemaphore(1)
+
+def wait_bounded(submit, slots, timeout):
+    """
+    Take a slot, start a task via submit() and wait for its Future.
+    Raises MLOverloaded immediately when no slot is free and MLTimeout when
+    the result is not ready in time (the task itself keeps its slot until done).
+    """
+    if not slots.acquire(blocking=False):
+        raise MLOverloaded()
+    try:
+        future = submit()
+    except Exception:
+        slots.release()
+        raise
+    future.add_done_callback(lambda _: slots.release())
+    
+    try:
+        return future.result(timeout=timeout)
+    except FutureTimeoutError:
+        raise MLTimeout()
+
+def run_ml_task(fn, *args, executor=None, slots=None, timeout=ML_TIMEOUT_SECONDS):
+    """Run a CPU-bound function on a bounded worker pool and wait for its result"""
+    executor = executor or ml_executor
+    slots = slots or ml_slots
+    return wait_bounded(lambda: executor.submit(fn, *args), slots, timeout)
+
+admission = AdmissionController(
+    classes={
+        'public': AdmissionClass(ADMISSION_PUBLIC_CLIENT_RATE, ADMISSION_PUBLIC_CLIENT_BURST,
+                                 ADMISSION_PUBLIC_ROUTE_RATE, ADMISSION_PUBLIC_ROUTE_BURST,
+                                 min(ML_PUBLIC_MAX_INFLIGHT, ML_WORKERS + ML_MAX_QUEUE)),
+        'user': AdmissionClass(ADMISSION_USER_CLIENT_RATE, ADMISSION_USER_CLIENT_BURST,
+                               ADMISSION_USER_ROUTE_RATE, ADMISSION_USER_ROUTE_BURST,
+                               ML_WORKERS + ML_MAX_QUEUE)
+    },
+    routes={
+        'ai_predict_public': 'public',
+        'ai_predict': 'user',
+        'get_recommendations': 'user'
+    }
+)
+
+def predict_crop(soil_data, timeout=ML_TIMEOUT_SECONDS, priority='user'):
+    """Score one sample through the micro-batcher, within the in-flight cap of its priority class"""
+    if not admission.acquire(priority):
+        raise MLOverloaded()
+    try:
+        return wait_bounded(lambda: prediction_batcher.submit(soil_data), ml_slots, timeout)
+    finally:
+        admission.release(priority)
+
+def optional_ai_prediction(soil_data):
+    """AI prediction for routes where it is an extra; skipped when the model is busy or still loading"""
+    if not model_ready.is_set() or ai_model is None:
+        return None
+    try:
+        ai_result = predict_crop(soil_data)
+    except (MLOverloaded, MLTimeout):
+        return None
+    if 'success' in ai_result:
+        return ai_result
+    return None
 
 # Real-world agricultural data from India
 agricultural_data = [
@@ -275,6 +593,32 @@ crops = [
     }
 ]
 
+# Training samples: de-duplicated on ingestion, with synthetic and sensor
+# samples held in a per-crop reservoir so retraining cost stays bounded
+stored_training_data = load_ai_training_data()
+training_set, training_data_trimmed = TrainingSet.load(
+    stored_training_data, load_ai_training_state(), [crop['name'] for crop in crops], AI_TRAINING_RESERVOIR_SIZE
+)
+if training_data_trimmed:
+    print(f"Training data: kept {len(training_set)} of {len(stored_training_data)} stored samples")
+    save_ai_training_data(training_set)
+del stored_training_data
+
+def reference_profile(record):
+    """Similar-farms profile for a training sample (real_data / manual samples only)"""
+    if not is_protected(record):
+        return None
+    return sample_profile(f'sample:{sample_key(record)}', record)
+
+def farm_profiles():
+    """Every profile for the initial similar-farms build"""
+    for record in training_set.snapshot():
+        yield reference_profile(record)
+    for email, user in list(users.items()):
+        yield user_profile(email, user)
+
+similar_farms = SimilarFarmIndex(farm_profiles, rebuild_threshold=SIMILAR_FARMS_REBUILD_CHANGES)
+
 
 def get_crop_recommendations(soil_data):
     """
@@ -321,12 +665,14 @@ def generate_sample_training_data():
     for data_point in agricultural_data:
         # Add some variation to the real data to create more training samples
         for variation in range(5):  # Create 5 variations of each real data point
+            # Seeded per variation so repeat calls produce the same (de-duplicated) samples
+            rng = random.Random(f"{data_point['crop']}|{data_point['state']}|{data_point['year']}|{variation}")
             sample_data.append({
-                'moisture': data_point['nitrogen'] + random.uniform(-10, 10),  # Use nitrogen as proxy for moisture
-                'ph': random.uniform(5.0, 7.5),  # Typical pH range
-                'nitrogen': data_point['nitrogen'] + random.uniform(-5, 5),
-                'phosphorus': data_point['phosphorus'] + random.uniform(-2, 2),
-                'potassium': data_point['potassium'] + random.uniform(-3, 3),
+                'moisture': data_point['nitrogen'] + rng.uniform(-10, 10),  # Use nitrogen as proxy for moisture
+                'ph': rng.uniform(5.0, 7.5),  # Typical pH range
+                'nitrogen': data_point['nitrogen'] + rng.uniform(-5, 5),
+                'phosphorus': data_point['phosphorus'] + rng.uniform(-2, 2),
+                'potassium': data_point['potassium'] + rng.uniform(-3, 3),
                 'crop': data_point['crop'],
                 'state': data_point['state'],
                 'yield': data_point['yield'],
@@ -386,19 +732,78 @@ def generate_sample_training_data():
     
     return sample_data
 
-def train_ai_model():
+def model_algorithm(model):
+    """Human-readable name of the deployed model type"""
+    return 'Random Forest (compact)' if type(model).__name__ == 'CompactForest' else 'Random Forest'
+
+def train_compact_model(full_model, X_train, y_train, X_test, y_test, options):
+    """
+    Fit a size-bounded compact forest and compare it with the full model.
+    Returns the compact model, its settings and an accuracy / size / latency
+    table for the full model and compact models at 1/4, 1/2 and all of the budget.
+    """
+    from sklearn.ensemble import RandomForestClassifier
+    from compact_forest import build_compact_forest, benchmark_model
+    
+    max_bytes = options['max_bytes']
+    
+    def fit_forest(max_leaf_nodes):
+        forest = RandomForestClassifier(n_estimators=options['n_estimators'], max_depth=options['max_depth'],
+                                        max_leaf_nodes=max_leaf_nodes, random_state=42)
+        return forest.fit(X_train, y_train)
+    
+    tradeoffs = [{
+        'model': 'full',
+        'n_estimators': len(full_model.estimators_),
+        'max_depth': None,
+        'max_leaf_nodes': None,
+        **benchmark_model(full_model, X_test, y_test)
+    }]
+    for fraction in (0.25, 0.5, 1.0):
+        budget = int(max_bytes * fraction)
+        compact, _, max_leaf_nodes = build_compact_forest(fit_forest, budget, options['max_leaf_nodes'])
+        row = {
+            'model': f'compact ({budget} byte budget)',
+            'n_estimators': compact.n_estimators,
+            'max_depth': options['max_depth'],
+            'max_leaf_nodes': max_leaf_nodes,
+            **benchmark_model(compact, X_test, y_test)
+        }
+        row['within_budget'] = row['size_bytes'] <= budget
+        tradeoffs.append(row)
+    
+    info = {
+        'max_bytes': max_bytes,
+        'size_bytes': row['size_bytes'],
+        'within_budget': row['within_budget'],
+        'n_estimators': compact.n_estimators,
+        'max_depth': options['max_depth'],
+        'max_leaf_nodes': row['max_leaf_nodes']
+    }
+    return compact, info, tradeoffs
+
+def train_ai_model(options=None):
     """Train AI model using collected data"""
     global ai_model, model_scaler, model_accuracy
+    options = options or {}
     
-    if len(ai_training_data) < 50:
+    training_data = training_set.snapshot()
+    if len(training_data) < 50:
         return {'error': 'Insufficient training data. Need at least 50 samples.'}
     
+    ensure_model_loaded()
+    import pandas as pd
+    from sklearn.ensemble import RandomForestClassifier
+    from sklearn.model_selection import train_test_split
+    from sklearn.preprocessing import StandardScaler
+    from sklearn.metrics import accuracy_score
+    
     try:
         # Convert to DataFrame
-        df = pd.DataFrame(ai_training_data)
+        df = pd.DataFrame(training_data)
         
         # Prepare features and target
-        features = ['moisture', 'ph', 'nitrogen', 'phosphorus', 'potassium']
+        features = MODEL_FEATURES
         X = df[features]
         y = df['crop']
         
@@ -406,80 +811,130 @@ def train_ai_model():
         X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.2, random_state=42)
         
         # Scale features
-        model_scaler = StandardScaler()
-        X_train_scaled = model_scaler.fit_transform(X_train)
-        X_test_scaled = model_scaler.transform(X_test)
+        scaler = StandardScaler()
+        X_train_scaled = scaler.fit_transform(X_train)
+        X_test_scaled = scaler.transform(X_test)
         
         # Train model
-        ai_model = RandomForestClassifier(n_estimators=100, random_state=42)
-        ai_model.fit(X_train_scaled, y_train)
+        model = RandomForestClassifier(n_estimators=100, random_state=42)
+        model.fit(X_train_scaled, y_train)
+        
+        # Optionally replace it with a compact, size-bounded version
+        compact_info = tradeoffs = None
+        if options.get('compact', AI_COMPACT_MODEL):
+            model, compact_info, tradeoffs = train_compact_model(
+                model, X_train_scaled, y_train, X_test_scaled, y_test, options
+            )
         
         # Evaluate model
-        y_pred = ai_model.predict(X_test_scaled)
-        model_accuracy = accuracy_score(y_test, y_pred)
+        y_pred = model.predict(X_test_scaled)
+        accuracy = accuracy_score(y_test, y_pred)
+        
+        # Distribution of the data the scaler was fit on, for drift monitoring
+        feature_stats = FeatureMonitor.from_rows(features, X_train.values.tolist(), list(y_train),
+                                                 snapshot_id=uuid.uuid4().hex)
+        
+        # Swap in the new model only once it is complete, since predictions
+        # may be running concurrently on the ML worker pool
+        ai_model, model_scaler, model_accuracy = model, scaler, accuracy
+        set_training_feature_stats(feature_stats)
+        touch_model()
+        schedule_recommendation_push()
         
         # Save model to file
-        save_ai_model(ai_model, model_scaler, model_accuracy)
+        save_ai_model(ai_model, model_scaler, model_accuracy, feature_stats)
         
-        return {
+        result = {
             'success': True,
             'accuracy': round(model_accuracy * 100, 2),
-            'training_samples': len(ai_training_data),
+            'training_samples': len(training_data),
             'test_samples': len(X_test),
             'model_info': {
-                'algorithm': 'Random Forest',
+                'algorithm': model_algorithm(model),
                 'features': features,
                 'classes': list(y.unique())
             }
         }
+        if compact_info is not None:
+            result['compact'] = compact_info
+            result['tradeoffs'] = tradeoffs
+        return result
     except Exception as e:
         return {'error': f'Model training failed: {str(e)}'}
 
-def ai_crop_prediction(soil_data):
-    """Use AI model to predict best crop"""
-    global ai_model, model_scaler
-    
-    if ai_model is None or model_scaler is None:
-        return {'error': 'AI model not trained yet'}
+def ai_crop_predictions(soil_data_list):
+    """Use AI model to predict best crop for many samples in one vectorized call"""
+    ensure_model_loaded()
+    import pandas as pd
+    
+    model, scaler, accuracy = ai_model, model_scaler, model_accuracy
+    if model is None or scaler is None:
+        return [{'error': 'AI model not trained yet'} for _ in soil_data_list]
+    
+    results = [None] * len(soil_data_list)
+    rows = []
+    row_indexes = []
+    for i, soil_data in enumerate(soil_data_list):
+        try:
+            rows.append([
+                float(soil_data.get('moisture', 0)),
+                float(soil_data.get('ph', 7)),
+                float(soil_data.get('nitrogen', 0)),
+                float(soil_data.get('phosphorus', 0)),
+                float(soil_data.get('potassium', 0))
+            ])
+            row_indexes.append(i)
+        except Exception as e:
+            results[i] = {'error': f'AI prediction failed: {str(e)}'}
+    
+    if not rows:
+        return results
     
     try:
         # Prepare input data with proper feature names
         features = ['moisture', 'ph', 'nitrogen', 'phosphorus', 'potassium']
-        input_data = pd.DataFrame([[
-            float(soil_data.get('moisture', 0)),
-            float(soil_data.get('ph', 7)),
-            float(soil_data.get('nitrogen', 0)),
-            float(soil_data.get('phosphorus', 0)),
-            float(soil_data.get('potassium', 0))
-        ]], columns=features)
-        
-        # Scale input
-        input_scaled = model_scaler.transform(input_data)
+        input_data = pd.DataFrame(rows, columns=features)
         
-        # Predict
-        prediction = ai_model.predict(input_scaled)[0]
-        probabilities = ai_model.predict_proba(input_scaled)[0]
-        classes = ai_model.classes_
+        # Scale and predict the whole batch at once
+        input_scaled = scaler.transform(input_data)
+        probabilities = model.predict_proba(input_scaled)
+        classes = model.classes_
+        best = probabilities.argmax(axis=1)
         
-        # Get top 3 predictions with confidence scores
-        top_predictions = []
-        for i, prob in enumerate(probabilities):
-            top_predictions.append({
-                'crop': classes[i],
-                'confidence': round(prob * 100, 2)
-            })
-        
-        top_predictions.sort(key=lambda x: x['confidence'], reverse=True)
-        
-        return {
-            'success': True,
-            'predicted_crop': prediction,
-            'confidence': round(max(probabilities) * 100, 2),
-            'top_predictions': top_predictions[:3],
-            'model_accuracy': round(model_accuracy * 100, 2)
-        }
+        for row, i in enumerate(row_indexes):
+            row_probabilities = probabilities[row]
+            
+            # Get top 3 predictions with confidence scores
+            top_predictions = []
+            for j, prob in enumerate(row_probabilities):
+                top_predictions.append({
+                    'crop': classes[j],
+                    'confidence': round(prob * 100, 2)
+                })
+            
+            top_predictions.sort(key=lambda x: x['confidence'], reverse=True)
+            
+            results[i] = {
+                'success': True,
+                'predicted_crop': classes[best[row]],
+                'confidence': round(row_probabilities[best[row]] * 100, 2),
+                'top_predictions': top_predictions[:3],
+                'model_accuracy': round(accuracy * 100, 2)
+            }
     except Exception as e:
-        return {'error': f'AI prediction failed: {str(e)}'}
+        for i in row_indexes:
+            results[i] = {'error': f'AI prediction failed: {str(e)}'}
+    
+    return results
+
+def ai_crop_prediction(soil_data):
+    """Use AI model to predict best crop"""
+    return ai_crop_predictions([soil_data])[0]
+
+prediction_batcher = MicroBatcher(ai_crop_predictions, ml_executor,
+                                  max_batch_size=ML_BATCH_MAX_SIZE,
+                                  max_wait_ms=ML_BATCH_MAX_WAIT_MS,
+                                  max_inflight=ML_WORKERS)
 
 def predict_crop_prices(crops_list, location_data=None):
     """
@@ -525,6 +980,47 @@ def predict_crop_prices(crops_list, location_data=None):
         })
     return predictions
 
+def client_address():
+    """Client IP used for per-client rate limits"""
+    if ADMISSION_TRUST_PROXY:
+        # Entries left of the ones our proxies appended are client-supplied
+        forwarded = [value.strip() for value in request.headers.get('X-Forwarded-For', '').split(',')]
+        if len(forwarded) >= ADMISSION_TRUST_PROXY and forwarded[-ADMISSION_TRUST_PROXY]:
+            return forwarded[-ADMISSION_TRUST_PROXY]
+    return request.remote_addr or 'unknown'
+
+@app.before_request
+def admission_control():
+    """Rate-limit inference routes before any work is done"""
+    if request.method != 'OPTIONS':
+        admission.admit(request.endpoint, client_address())
+
+@app.errorhandler(RateLimited)
+def handle_rate_limited(e):
+    """Fast rejection when a client or route is over its rate limit"""
+    response = jsonify({
+        'error': 'Too many requests, please retry later',
+        'retry_after': e.retry_after
+    })
+    response.headers['Retry-After'] = str(e.retry_after)
+    return response, 429
+
+@app.errorhandler(MLOverloaded)
+def handle_ml_overloaded(e):
+    """Fast rejection when the ML worker queue (or this route's share of it) is full"""
+    admission.shed(request.endpoint)
+    response = jsonify({
+        'error': 'AI service is busy, please retry shortly',
+        'retry_after': 1
+    })
+    response.headers['Retry-After'] = '1'
+    return response, 503
+
+@app.errorhandler(MLTimeout)
+def handle_ml_timeout(e):
+    """AI task did not finish within its deadline"""
+    return jsonify({'error': 'AI request timed out'}), 504
+
 @app.route('/api/ai/feed-data', methods=['POST'])
 def feed_training_data():
     """API to feed training data to AI model"""
@@ -560,20 +1056,56 @@ def feed_training_data():
         'timestamp': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
         'source': data.get('source', 'manual')
     }
-    
-    ai_training_data.append(training_record)
-    save_ai_training_data(ai_training_data)
-    
+    record_feature_stats(training_record, training_record['crop'])
+    
+    outcome = training_set.add(training_record)
+    stored = outcome in ('added', 'promoted', 'replaced')
+    if stored:
+        save_ai_training_data(training_set)
+    if outcome != 'sampled_out':
+        similar_farms.upsert(reference_profile(training_record))
+    touch_training_data()
+    
+    messages = {
+        'added': 'Training data added successfully',
+        'promoted': 'Training data added successfully (kept in place of an equal reservoir sample)',
+        'replaced': 'Training data added successfully (replaced an older sample)',
+        'duplicate': 'Duplicate sample ignored',
+        'sampled_out': 'Sample not kept, the training set for this crop is full'
+    }
     return jsonify({
         'success': True,
-        'message': 'Training data added successfully',
-        'total_samples': len(ai_training_data)
+        'message': messages[outcome],
+        'stored': stored,
+        'outcome': outcome,
+        'total_samples': len(training_set)
     })
 
 @app.route('/api/ai/train', methods=['POST'])
 def train_model():
-    """API to train the AI model"""
-    result = train_ai_model()
+    """API to train the AI model (optionally as a compact, size-bounded model)"""
+    data = request.get_json(silent=True) or {}
+    compact = data.get('compact', AI_COMPACT_MODEL)
+    if not isinstance(compact, bool):
+        return jsonify({'error': 'compact must be true or false'}), 400
+    try:
+        options = {
+            'compact': compact,
+            'max_bytes': int(data.get('max_bytes', AI_COMPACT_MAX_BYTES)),
+            'n_estimators': int(data.get('n_estimators', AI_COMPACT_N_ESTIMATORS)),
+            'max_depth': int(data.get('max_depth', AI_COMPACT_MAX_DEPTH)),
+            'max_leaf_nodes': int(data.get('max_leaf_nodes', AI_COMPACT_MAX_LEAF_NODES))
+        }
+    except (TypeError, ValueError):
+        return jsonify({'error': 'max_bytes, n_estimators, max_depth and max_leaf_nodes must be integers'}), 400
+    if min(options['max_bytes'], options['n_estimators'], options['max_depth']) < 1 or options['max_leaf_nodes'] < 2:
+        return jsonify({'error': 'Compact model limits must be positive (max_leaf_nodes at least 2)'}), 400
+    
+    try:
+        result = run_ml_task(train_ai_model, options, executor=train_executor, slots=train_slots,
+                             timeout=TRAIN_TIMEOUT_SECONDS)
+    except MLOverloaded:
+        return jsonify({'error': 'Model training already in progress'}), 409
     
     if 'error' in result:
         return jsonify(result), 400
@@ -587,7 +1119,7 @@ def ai_predict():
     if not data:
         return jsonify({'error': 'No soil data provided'}), 400
     
-    result = ai_crop_prediction(data)
+    result = predict_crop(data)
     
     if 'error' in result:
         return jsonify(result), 400
@@ -620,10 +1152,11 @@ def ai_predict_public():
         'phosphorus': float(data.get('phosphorus', 0)),
         'potassium': float(data.get('potassium', 0))
     }
+    record_feature_stats(soil_data)
     
     # Get both traditional and AI predictions
     traditional_recommendations = get_crop_recommendations(soil_data)
-    ai_prediction = ai_crop_prediction(soil_data)
+    ai_prediction = predict_crop(soil_data, priority='public')
     
     response = {
         'timestamp': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
@@ -633,7 +1166,7 @@ def ai_predict_public():
         'model_status': {
             'trained': ai_model is not None,
             'accuracy': round(model_accuracy * 100, 2) if model_accuracy > 0 else 0,
-            'training_samples': len(ai_training_data)
+            'training_samples': len(training_set)
         }
     }
     
@@ -642,36 +1175,56 @@ def ai_predict_public():
 @app.route('/api/ai/status', methods=['GET'])
 def ai_status():
     """API to get AI model status and statistics"""
-    return jsonify({
+    batching = prediction_batcher.stats()
+    # Only the other workers' file names, sizes and mtimes go into the ETag;
+    # they are parsed and merged once the response is known to have changed
+    worker_files = worker_feature_stats.other_files()
+    etag = (f"{ETAG_EPOCH}-m{model_version}-t{training_data_version}-b{batching['batches']}"
+            f"-s{worker_feature_stats.version(live_feature_stats, worker_files)}")
+    last_modified = max(model_modified, training_data_modified)
+    cached = not_modified(etag, last_modified)
+    if cached is not None:
+        return cached
+    
+    feature_monitoring = worker_feature_stats.merged(live_feature_stats, worker_files).compare(training_feature_stats)
+    response = jsonify({
         'model_trained': ai_model is not None,
         'model_accuracy': round(model_accuracy * 100, 2) if model_accuracy > 0 else 0,
-        'training_samples': len(ai_training_data),
+        'training_samples': len(training_set),
+        'training_set': training_set.stats(),
         'model_info': {
-            'algorithm': 'Random Forest',
-            'features': ['moisture', 'ph', 'nitrogen', 'phosphorus', 'potassium'],
-            'last_trained': datetime.now().strftime('%Y-%m-%d %H:%M:%S') if ai_model else None
-        }
+            'algorithm': model_algorithm(ai_model),
+            'features': MODEL_FEATURES,
+            'last_trained': model_modified.strftime('%Y-%m-%d %H:%M:%S') if ai_model else None
+        },
+        'batching': batching,
+        'feature_monitoring': feature_monitoring
     })
+    return set_validators(response, etag, last_modified)
 
 @app.route('/api/ai/generate-sample-data', methods=['POST'])
 def generate_sample_data():
     """API to generate sample training data"""
     sample_data = generate_sample_training_data()
-    ai_training_data.extend(sample_data)
-    save_ai_training_data(ai_training_data)
+    outcomes = training_set.extend(sample_data)
+    save_ai_training_data(training_set)
+    for record in sample_data:
+        similar_farms.upsert(reference_profile(record))
+    touch_training_data()
     
     return jsonify({
         'success': True,
         'message': f'Generated {len(sample_data)} sample training records',
-        'total_samples': len(ai_training_data)
+        'ingestion': outcomes,
+        'total_samples': len(training_set)
     })
 
 @app.route('/api/ai/training-data', methods=['GET'])
 def get_training_data():
     """API to get training data (for debugging/analysis)"""
     return jsonify({
-        'training_data': ai_training_data[-100:],  # Return last 100 records
-        'total_samples': len(ai_training_data)
+        'training_data': training_set.snapshot()[-100:],  # Return last 100 records
+        'total_samples': len(training_set)
     })
 
 @app.route('/api/signup', methods=['POST'])
@@ -695,8 +1248,10 @@ def signup():
         'soil_data': {},
         'crop_history': []
     }
+    index_user(email)
     save_users(users)
     save_email(email)
+    touch_user(email)
     return jsonify({
         'success': True, 
         'message': 'User registered successfully. 45-day trial started.',
@@ -731,13 +1286,18 @@ def store_user_data():
             'timestamp': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
             **data['soil_data']
         }
+        soil_history.record(email, data['soil_data'])
     
     # Update any other provided fields
     for key, value in data.items():
         if key not in ['email', 'soil_data']:
             user_data[key] = value
     
+    index_user(email)
     save_users(users)
+    touch_user(email)
+    if 'soil_data' in data:
+        schedule_recommendation_push([email])
     
     return jsonify({
         'success': True, 
@@ -749,8 +1309,14 @@ def get_user(email):
     """API to retrieve a user's data"""
     if email not in users:
         return jsonify({'error': 'User not found'}), 404
-    user_data = users[email].copy()
-    return jsonify(user_data)
+    
+    state = user_version(email)
+    etag = f"{ETAG_EPOCH}-u{state['version']}"
+    cached = not_modified(etag, state['modified'])
+    if cached is not None:
+        return cached
+    
+    return set_validators(jsonify(users[email]), etag, state['modified'])
 
 @app.route('/api/user/<email>', methods=['DELETE'])
 def delete_user(email):
@@ -760,7 +1326,10 @@ def delete_user(email):
     
     # Remove user from dictionary
     del users[email]
+    index_user(email)
     save_users(users)
+    soil_history.delete(email)
+    touch_user(email)
     
     return jsonify({
         'success': True,
@@ -776,46 +1345,120 @@ def update_user(email):
     data = request.json
     if not data:
         return jsonify({'error': 'No data provided'}), 400
-    for key, value in data.items():
-        if key != 'email':
-            users[email][key] = value
-    
+    updates = {key: value for key, value in data.items() if key != 'email'}
+    index_user(email, {**users[email], **updates})
+    users[email].update(updates)
     save_users(users)
+    touch_user(email)
     
     return jsonify({
         'success': True,
         'message': 'User data updated successfully'
     })
 
-@app.route('/api/recommendations/<email>', methods=['GET'])
-def get_recommendations(email):
-    """API to get crop recommendations and price predictions based on soil data"""
-    if email not in users:
-        return jsonify({'error': 'User not found'}), 404
-    
+ADMIN_PAGE_SIZE = 50
+ADMIN_MAX_PAGE_SIZE = 500
+ADMIN_FILTERS = {'crop': 'crop', 'region': 'region', 'tier': 'tier'}
+
+def admin_page_size():
+    """Page size from the limit query argument, clamped to ADMIN_MAX_PAGE_SIZE"""
+    try:
+        limit = int(request.args.get('limit', ADMIN_PAGE_SIZE))
+    except ValueError:
+        limit = ADMIN_PAGE_SIZE
+    return max(1, min(limit, ADMIN_MAX_PAGE_SIZE))
+
+def admin_user_summary(email):
+    """Fields of a user shown in admin listings"""
     user_data = users[email]
-    soil_data = user_data.get('soil_data', {})
+    return {
+        'email': email,
+        'fullName': user_data.get('fullName'),
+        'cropType': user_data.get('cropType'),
+        'location': user_data.get('location'),
+        'subscription_tier': user_data.get('subscription_tier'),
+        'trial_end_date': user_data.get('trial_end_date'),
+        'is_active': user_data.get('is_active')
+    }
+
+@app.before_request
+def require_admin_token():
+    """Admin routes need the ADMIN_TOKEN bearer token and are hidden without one"""
+    if not request.path.startswith('/api/admin/') or request.method == 'OPTIONS':
+        return None
+    if not ADMIN_TOKEN:
+        return jsonify({'error': 'API endpoint not found'}), 404
+    scheme, _, token = request.headers.get('Authorization', '').partition(' ')
+    if scheme.lower() != 'bearer' or not hmac.compare_digest(token.strip().encode(), ADMIN_TOKEN.encode()):
+        return jsonify({'error': 'Admin token required'}), 401
+    return None
+
+@app.route('/api/admin/users/trial-expiring', methods=['GET'])
+def admin_trial_expiring():
+    """API to list users whose trial ends in a date range (default: the next 7 days)"""
+    today = datetime.now()
+    start = request.args.get('from', today.strftime('%Y-%m-%d'))
+    end = request.args.get('to', (today + timedelta(days=7)).strftime('%Y-%m-%d'))
+    for value in (start, end):
+        try:
+            datetime.strptime(value, '%Y-%m-%d')
+        except ValueError:
+            return jsonify({'error': 'Dates must be in YYYY-MM-DD format'}), 400
     
-    if not soil_data:
+    cursor = request.args.get('cursor')
+    if cursor:
+        cursor = cursor.split('|', 1)
+        if len(cursor) != 2:
+            return jsonify({'error': 'Invalid cursor'}), 400
+    
+    emails, next_cursor, total = user_indexes.trial_ending(start, end, admin_page_size(), cursor)
+    return jsonify({
+        'from': start,
+        'to': end,
+        'total': total,
+        'users': [admin_user_summary(email) for email in emails],
+        'next_cursor': '|'.join(next_cursor) if next_cursor else None
+    })
+
+@app.route('/api/admin/users', methods=['GET'])
+def admin_find_users():
+    """API to list users by crop type, region and/or subscription tier"""
+    filters = {field: request.args[arg] for arg, field in ADMIN_FILTERS.items() if request.args.get(arg)}
+    if not filters:
         return jsonify({
-            'error': 'No soil data available',
-            'message': 'Please submit soil data first'
+            'error': 'At least one filter is required',
+            'filters': list(ADMIN_FILTERS)
         }), 400
-    recommended_crops = get_crop_recommendations(soil_data)
     
-    if not recommended_crops:
+    emails, next_cursor, total = user_indexes.lookup(filters, admin_page_size(), request.args.get('cursor'))
+    return jsonify({
+        'filters': filters,
+        'total': total,
+        'users': [admin_user_summary(email) for email in emails],
+        'next_cursor': next_cursor
+    })
+
+@app.route('/api/admin/users/counts', methods=['GET'])
+def admin_user_counts():
+    """API to count users by crop, region, tier or crop and region"""
+    group_by = request.args.get('by', 'crop').replace(',', '_')
+    if group_by == 'region_crop':
+        group_by = 'crop_region'
+    if group_by not in ('crop', 'region', 'tier', 'crop_region'):
         return jsonify({
-            'message': 'No suitable crops found for your soil parameters',
-            'recommendations': []
-        })
-    
-    # Get AI prediction if model is trained
-    ai_prediction = None
-    if ai_model is not None:
-        ai_result = ai_crop_prediction(soil_data)
-        if 'success' in ai_result:
-            ai_prediction = ai_result
+            'error': 'Invalid grouping',
+            'valid': ['crop', 'region', 'tier', 'crop,region']
+        }), 400
     
+    fields = group_by.split('_')
+    counts = [
+        {**dict(zip(fields, key.split('|', 1))), 'count': count}
+        for key, count in sorted(user_indexes.counts(group_by).items())
+    ]
+    return jsonify({'by': request.args.get('by', 'crop'), 'counts': counts})
+
+def build_recommendations(user_data, soil_data, recommended_crops, ai_prediction):
+    """Recommendation response with price predictions for a user's soil data"""
     location_data = {
         'region': user_data.get('location', {}).get('region', 'unknown'),
         'rainfall': user_data.get('location', {}).get('rainfall', 'normal'),
@@ -841,6 +1484,118 @@ def get_recommendations(email):
         'ai_prediction': ai_prediction,
         'recommendation_summary': f"Found {len(recommended_crops)} suitable crops for your soil conditions."
     }
+    return response
+
+def push_recommendations(emails):
+    """Recompute recommendations for subscribed users and push them over SSE"""
+    emails = [email for email in emails if email in users and users[email].get('soil_data')]
+    if not emails:
+        return
+    
+    # Score every subscriber's soil data in one batch
+    ai_results = [None] * len(emails)
+    if model_ready.is_set() and ai_model is not None:
+        ai_results = ai_crop_predictions([users[email]['soil_data'] for email in emails])
+    
+    for email, ai_result in zip(emails, ai_results):
+        user_data = users[email]
+        soil_data = user_data['soil_data']
+        recommended_crops = get_crop_recommendations(soil_data)
+        if not recommended_crops:
+            payload = {
+                'message': 'No suitable crops found for your soil parameters',
+                'recommendations': []
+            }
+        else:
+            ai_prediction = ai_result if ai_result and 'success' in ai_result else None
+            payload = build_recommendations(user_data, soil_data, recommended_crops, ai_prediction)
+        event_hub.publish(email, 'recommendations', payload)
+
+def schedule_recommendation_push(emails=None):
+    """Queue a recommendation push for the given users (default: all subscribers) that are listening"""
+    subscribed = set(event_hub.topics())
+    targets = subscribed if emails is None else subscribed.intersection(emails)
+    if targets:
+        push_executor.submit(push_recommendations, sorted(targets))
+
+# Recommendation pushes run off the request thread, one batch at a time
+push_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='sse-push')
+event_hub = EventHub(can_subscribe=lambda email: email in users,
+                     on_subscribe=lambda email: schedule_recommendation_push([email]),
+                     secret=SSE_INTERNAL_TOKEN or shared_secret(os.path.join(DATA_DIR, 'sse_internal.token')))
+
+def start_event_server():
+    """
+    Start the SSE listener for recommendation updates, or forward events to
+    the worker process that already listens on SSE_PORT
+    """
+    if event_hub.available:
+        return True
+    if event_hub.start(SSE_HOST, SSE_PORT):
+        print(f"SSE listener running on port {SSE_PORT} (pid {os.getpid()})")
+    elif event_hub.forwarding:
+        print(f"SSE port {SSE_PORT} is owned by another worker; forwarding events to it")
+    else:
+        print(f"SSE server could not start on port {SSE_PORT}: {event_hub.start_error}")
+    return event_hub.available
+
+@app.before_request
+def ensure_event_server():
+    """
+    Start or join the SSE listener in each process that serves requests (never in
+    a reloader parent); the first one to bind SSE_PORT owns it
+    """
+    if SSE_ENABLED and event_hub.address is None:
+        start_event_server()
+
+@app.route('/api/recommendations/<email>/events', methods=['GET'])
+def recommendation_events(email):
+    """API to subscribe to pushed recommendation updates (Server-Sent Events)"""
+    if email not in users:
+        return jsonify({'error': 'User not found'}), 404
+    if not event_hub.available:
+        return jsonify({'error': 'Recommendation event stream is not available'}), 503
+    
+    base_url = SSE_PUBLIC_URL or f"{request.scheme}://{request.host.rsplit(':', 1)[0]}:{SSE_PORT}"
+    return redirect(f"{base_url.rstrip('/')}/events/{quote(email, safe='')}", code=307)
+
+@app.route('/api/recommendations/<email>', methods=['GET'])
+def get_recommendations(email):
+    """API to get crop recommendations and price predictions based on soil data"""
+    if email not in users:
+        return jsonify({'error': 'User not found'}), 404
+    
+    # Recommendations depend only on the user's inputs and the model
+    state = user_version(email)
+    etag = f"{ETAG_EPOCH}-u{state['inputs_version']}-m{model_version}"
+    last_modified = max(state['inputs_modified'], model_modified)
+    cached = not_modified(etag, last_modified)
+    if cached is not None:
+        return cached
+    
+    user_data = users[email]
+    soil_data = user_data.get('soil_data', {})
+    
+    if not soil_data:
+        return jsonify({
+            'error': 'No soil data available',
+            'message': 'Please submit soil data first'
+        }), 400
+    recommended_crops = get_crop_recommendations(soil_data)
+    
+    if not recommended_crops:
+        return jsonify({
+            'message': 'No suitable crops found for your soil parameters',
+            'recommendations': []
+        })
+    
+    # Get AI prediction if model is trained and not saturated
+    ai_prediction = optional_ai_prediction(soil_data)
+    response = build_recommendations(user_data, soil_data, recommended_crops, ai_prediction)
+    # Skipped because the model was busy or still loading (not because there
+    # is no model): this degraded response must not be revalidated later
+    ai_skipped = ai_prediction is None and (not model_ready.is_set() or ai_model is not None)
+    
     timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
     history_entry = {
         'timestamp': timestamp,
@@ -856,8 +1611,13 @@ def get_recommendations(email):
         user_data['crop_history'] = user_data['crop_history'][-10:]
     
     save_users(users)
+    touch_user(email, inputs_changed=False)
     
-    return jsonify(response)
+    if ai_skipped:
+        response = jsonify(response)
+        response.headers['Cache-Control'] = 'no-store'
+        return response
+    return set_validators(jsonify(response), etag, last_modified)
 
 @app.route('/api/health', methods=['GET'])
 def health_check():
@@ -869,6 +1629,28 @@ def health_check():
         'version': '1.0.0'
     })
 
+@app.route('/api/admission/stats', methods=['GET'])
+def admission_stats():
+    """API to get admit / reject counters and limits of the inference routes"""
+    return jsonify({
+        'timestamp': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+        **admission.stats()
+    })
+
+@app.route('/api/ready', methods=['GET'])
+def readiness_check():
+    """API endpoint to check if the ML stack and model are loaded"""
+    ready = model_ready.is_set()
+    response = jsonify({
+        'status': 'ready' if ready else 'warming_up',
+        'model_loaded': ai_model is not None,
+        'startup_timings': startup_timings
+    })
+    if not ready:
+        response.headers['Retry-After'] = '1'
+        return response, 503
+    return response
+
 @app.route('/api/soil-data/<email>', methods=['POST'])
 def upload_soil_data(email):
     """API to upload soil data for a specific user"""
@@ -889,16 +1671,16 @@ def upload_soil_data(email):
         'timestamp': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
         **data
     }
+    index_user(email)
     save_users(users)
+    soil_history.record(email, data)
+    touch_user(email)
+    schedule_recommendation_push([email])
     
     recommended_crops = get_crop_recommendations(data)[:3]  # Top 3 recommendations
     
-    # Get AI prediction if model is trained
-    ai_prediction = None
-    if ai_model is not None:
-        ai_result = ai_crop_prediction(data)
-        if 'success' in ai_result:
-            ai_prediction = ai_result
+    # Get AI prediction if model is trained and not saturated
+    ai_prediction = optional_ai_prediction(data)
     
     response = {
         'success': True,
@@ -909,8 +1691,129 @@ def upload_soil_data(email):
     
     return jsonify(response)
 
-from flask import send_from_directory
-import os
+def parse_history_time(value, end_of_day=False):
+    """Parse 'YYYY-MM-DD HH:MM:SS' or 'YYYY-MM-DD' into epoch seconds"""
+    try:
+        return datetime.strptime(value, '%Y-%m-%d %H:%M:%S').timestamp()
+    except ValueError:
+        day = datetime.strptime(value, '%Y-%m-%d')
+        if end_of_day:
+            day += timedelta(days=1, seconds=-1)
+        return day.timestamp()
+
+@app.route('/api/soil-history/<email>', methods=['GET'])
+def get_soil_history(email):
+    """API to get a user's soil readings over a time range (raw, hourly or daily rollups)"""
+    if email not in users:
+        return jsonify({'error': 'User not found'}), 404
+    
+    now = datetime.now()
+    try:
+        end = parse_history_time(request.args['to'], end_of_day=True) if 'to' in request.args else now.timestamp()
+        start = (parse_history_time(request.args['from']) if 'from' in request.args
+                 else (now - timedelta(days=30)).timestamp())
+    except ValueError:
+        return jsonify({'error': 'Dates must be in YYYY-MM-DD or YYYY-MM-DD HH:MM:SS format'}), 400
+    if start > end:
+        return jsonify({'error': '"from" must not be after "to"'}), 400
+    
+    resolution = request.args.get('resolution', 'auto')
+    if resolution != 'auto' and resolution not in RESOLUTIONS:
+        return jsonify({
+            'error': 'Invalid resolution',
+            'valid': ['auto'] + list(RESOLUTIONS)
+        }), 400
+    
+    params = request.args.get('params')
+    params = [p.strip() for p in params.split(',')] if params else list(SOIL_PARAMETERS)
+    invalid = [p for p in params if p not in SOIL_PARAMETERS]
+    if invalid:
+        return jsonify({
+            'error': 'Invalid soil parameters',
+            'invalid': invalid,
+            'valid': list(SOIL_PARAMETERS)
+        }), 400
+    
+    resolution, points = soil_history.query(email, start, end, resolution, params)
+    return jsonify({
+        'email': email,
+        'from': datetime.fromtimestamp(start).strftime('%Y-%m-%d %H:%M:%S'),
+        'to': datetime.fromtimestamp(end).strftime('%Y-%m-%d %H:%M:%S'),
+        'resolution': resolution,
+        'points': len(points['timestamps']),
+        'series': points
+    })
+
+def similar_farms_query(point, exclude=None, options=None):
+    """Run a similar-farms query with k / state / crop taken from options"""
+    options = options or {}
+    try:
+        k = int(options.get('k', 10))
+    except (TypeError, ValueError):
+        return jsonify({'error': 'k must be an integer'}), 400
+    if not 1 <= k <= SIMILAR_FARMS_MAX_K:
+        return jsonify({'error': f'k must be between 1 and {SIMILAR_FARMS_MAX_K}'}), 400
+    state = options.get('state') or None
+    crop = options.get('crop') or None
+    
+    started = time.perf_counter()
+    neighbors = similar_farms.query(point, k=k, crop=crop, state=state, exclude=exclude)
+    return jsonify({
+        'query': dict(zip(FARM_FEATURES, point)),
+        'filters': {'state': state, 'crop': crop},
+        'k': k,
+        'neighbors': neighbors,
+        'summary': summarize(neighbors),
+        'took_ms': round((time.perf_counter() - started) * 1000, 3),
+        'index': similar_farms.stats()
+    })
+
+@app.route('/api/similar-farms', methods=['POST'])
+def similar_farms_for_soil():
+    """API to find farms and reference samples with soil most like the given values"""
+    data = request.get_json(silent=True)
+    if not data:
+        return jsonify({'error': 'No soil data provided'}), 400
+    
+    missing = [feature for feature in FARM_FEATURES if feature not in data]
+    if missing:
+        return jsonify({
+            'error': 'Missing required soil parameters',
+            'missing': missing,
+            'required': list(FARM_FEATURES)
+        }), 400
+    try:
+        point = [float(data[feature]) for feature in FARM_FEATURES]
+    except (TypeError, ValueError):
+        return jsonify({'error': 'Soil parameters must be numbers'}), 400
+    
+    return similar_farms_query(point, options=data)
+
+@app.route('/api/similar-farms/<email>', methods=['GET'])
+def similar_farms_for_user(email):
+    """API to find farms and reference samples with soil most like a user's latest soil data"""
+    if email not in users:
+        return jsonify({'error': 'User not found'}), 404
+    
+    profile = user_profile(email, users[email])
+    if profile is None:
+        return jsonify({
+            'error': 'No complete soil data available',
+            'message': 'Please submit moisture, pH, nitrogen, phosphorus and potassium first'
+        }), 400
+    
+    return similar_farms_query(profile['point'], exclude=profile['id'], options=request.args)
+
+def warm_up():
+    """Load the model and build the similar-farms index ahead of the first request"""
+    ensure_model_loaded()
+    started = time.perf_counter()
+    similar_farms.ensure_built()
+    startup_timings['similar_farms_build_seconds'] = round(time.perf_counter() - started, 4)
+
+# Manifest of the built frontend, scanned once at startup; compressed
+# variants the build did not produce are generated into data/static_cache/
+static_assets = StaticAssets(DIST_DIR, cache_dir=os.path.join(DATA_DIR, 'static_cache'))
 
 # Serve React App (production build)
 @app.route('/', defaults={'path': ''})
@@ -920,22 +1823,21 @@ def serve_react_app(path):
     if path.startswith('api/'):
         return jsonify({'error': 'API endpoint not found'}), 404
     
-    dist_dir = os.path.join(os.path.dirname(__file__), '..', 'dist')
-    
-    # Check if dist folder exists
-    if not os.path.exists(dist_dir):
+    # Check if dist folder was built
+    if not static_assets.available:
         return jsonify({
             'error': 'Frontend not built',
-            'message': 'Please run "npm run build" to build the frontend first',
+            'message': 'Please run "npm run build" and restart the backend',
             'api_status': 'Backend API is running on /api/*'
         }), 200
     
-    # Serve static files
-    if path and os.path.exists(os.path.join(dist_dir, path)):
-        return send_from_directory(dist_dir, path)
-    else:
-        # Serve index.html for all other routes (React Router)
-        return send_from_directory(dist_dir, 'index.html')
+    # Serve static files, or index.html for all other routes (React Router)
+    return static_assets.serve(path, request)
+
+if ML_WARMUP:
+    threading.Thread(target=warm_up, name='ml-warmup', daemon=True).start()
+
+startup_timings['app_import_seconds'] = round(time.perf_counter() - IMPORT_STARTED, 4)
 
 if __name__ == '__main__':
     print("=" * 60)
@@ -944,6 +1846,8 @@ if __name__ == '__main__':
     print(f"Server running on: http://localhost:5000")
     print(f"API endpoints available at: http://localhost:5000/api/*")
     print(f"Health check: http://localhost:5000/api/health")
+    print(f"Readiness check: http://localhost:5000/api/ready")
+    print(f"Recommendation events (SSE): http://localhost:{SSE_PORT}/events/<email>")
     print("")
     print("To serve the frontend:")
     print("1. Build frontend: npm run build")
@@ -954,4 +1858,4 @@ if __name__ == '__main__':
     print("- Frontend will be at: http://localhost:5173")
     print("- Backend API at: http://localhost:5000/api")
     print("=" * 60)
-    app.run(debug=True, host='0.0.0.0', port=5000)
\ No newline at end of file
+    app.run(debug=True, host='0.0.0.0', port=5000, threaded=True)
\ No newline at end of file
@@ -0,0 +1,77 @@
+"""
+Startup-time benchmark for the backend.
+
+Each run imports app.py in a fresh interpreter and measures:
+  - import:        time to import the app module
+  - first_health:  latency of the first GET /api/health
+  - ready:         time from process start until GET /api/ready returns 200
+  - first_predict: latency of the first POST /api/ai/predict-public
+
+Runs are repeated with the background warm-up on (default) and off
+(ML_WARMUP=0, model loaded by the first ML request). Only read-only
+endpoints are exercised, so the data directory is left untouched.
+
+Usage:
+    python bench_startup.py [--runs 5]
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+
+CHILD_SCRIPT = """
+import io, json, sys, time, contextlib
+started = time.perf_counter()
+with contextlib.redirect_stdout(io.StringIO()):
+    import app
+imported = time.perf_counter()
+
+client = app.app.test_client()
+client.get('/api/health')
+first_health = time.perf_counter() - imported
+
+predict_started = time.perf_counter()
+client.post('/api/ai/predict-public', json={'moisture': 70, 'ph': 6.5, 'nitrogen': 120})
+first_predict = time.perf_counter() - predict_started
+
+while client.get('/api/ready').status_code != 200:
+    time.sleep(0.005)
+ready = time.perf_counter() - started
+
+print(json.dumps({
+    'import': imported - started,
+    'first_health': first_health,
+    'ready': ready,
+    'first_predict': first_predict
+}))
+"""
+
+METRICS = ['import', 'first_health', 'ready', 'first_predict']
+
+
+def run_once(warmup):
+    env = dict(os.environ, ML_WARMUP='1' if warmup else '0')
+    output = subprocess.run([sys.executable, '-c', CHILD_SCRIPT], cwd=BACKEND_DIR, env=env,
+                            capture_output=True, text=True, check=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure backend import and first-request latency')
+    parser.add_argument('--runs', type=int, default=5, help='runs per mode (default: 5)')
+    args = parser.parse_args()
+
+    print(f"{'mode':<12}" + ''.join(f'{m:>16}' for m in METRICS))
+    for warmup in (True, False):
+        results = [run_once(warmup) for _ in range(args.runs)]
+        medians = [statistics.median(r[m] for r in results) * 1000 for m in METRICS]
+        mode = 'warmup' if warmup else 'lazy'
+        print(f'{mode:<12}' + ''.join(f'{v:>13.1f} ms' for v in medians))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,134 @@
+"""
+Compact random forest for memory-constrained deployments.
+
+A fitted scikit-learn RandomForestClassifier is flattened into a handful of
+NumPy arrays: split features as int8, thresholds as float32, child links as
+int32 and leaf class distributions quantized to uint8. CompactForest exposes
+classes_, predict and predict_proba so it can stand in for the original
+model, and build_compact_forest() shrinks the forest until its pickled size
+fits a byte budget.
+"""
+import pickle
+import time
+
+import numpy as np
+
+LEAF_SCALE = 255
+
+
+class CompactForest:
+    """Array-backed, quantized forest with the predict API of a classifier"""
+
+    def __init__(self, forest, n_trees=None):
+        estimators = forest.estimators_[:n_trees] if n_trees else forest.estimators_
+        self.classes_ = forest.classes_
+        self.n_features_in_ = forest.n_features_in_
+        self.n_estimators = len(estimators)
+
+        features, thresholds, lefts, rights, leaves, roots = [], [], [], [], [], []
+        node_offset = 0
+        leaf_offset = 0
+        for estimator in estimators:
+            tree = estimator.tree_
+            is_leaf = tree.children_left == -1
+            internal = ~is_leaf
+            leaf_ids = np.cumsum(is_leaf) - 1 + leaf_offset
+            internal_ids = np.cumsum(internal) - 1 + node_offset
+
+            # Only internal nodes are stored; a link to a leaf is encoded
+            # as -1 - leaf index
+            def link(children):
+                children = children[internal]
+                return np.where(is_leaf[children], -1 - leaf_ids[children], internal_ids[children])
+
+            roots.append(internal_ids[0] if internal[0] else -1 - leaf_ids[0])
+            lefts.append(link(tree.children_left))
+            rights.append(link(tree.children_right))
+
+            features.append(tree.feature[internal])
+            thresholds.append(tree.threshold[internal])
+
+            values = tree.value[is_leaf, 0, :]
+            values = values / np.maximum(values.sum(axis=1, keepdims=True), 1e-12)
+            leaves.append(values)
+
+            node_offset += int(internal.sum())
+            leaf_offset += int(is_leaf.sum())
+
+        self.feature = np.concatenate(features).astype(np.int8)
+        self.threshold = np.concatenate(thresholds).astype(np.float32)
+        self.left = np.concatenate(lefts).astype(np.int32)
+        self.right = np.concatenate(rights).astype(np.int32)
+        self.roots = np.asarray(roots, dtype=np.int32)
+        self.leaf_values = np.round(np.concatenate(leaves) * LEAF_SCALE).astype(np.uint8)
+
+    @property
+    def n_nodes(self):
+        return len(self.feature) + len(self.leaf_values)
+
+    def _leaf_indices(self, X):
+        X = np.asarray(X, dtype=np.float32)
+        nodes = np.broadcast_to(self.roots, (len(X), len(self.roots))).copy()
+        active = nodes >= 0
+        while active.any():
+            current = nodes[active]
+            go_left = X[np.nonzero(active)[0], self.feature[current]] <= self.threshold[current]
+            nodes[active] = np.where(go_left, self.left[current], self.right[current])
+            active = nodes >= 0
+        return -1 - nodes
+
+    def predict_proba(self, X):
+        leaves = self._leaf_indices(X)
+        distributions = self.leaf_values[leaves].astype(np.float32)
+        distributions /= np.maximum(distributions.sum(axis=2, keepdims=True), 1)
+        return distributions.mean(axis=1)
+
+    def predict(self, X):
+        return self.classes_[self.predict_proba(X).argmax(axis=1)]
+
+
+def model_size(model):
+    """Pickled size of a model in bytes"""
+    return len(pickle.dumps(model, protocol=pickle.HIGHEST_PROTOCOL))
+
+
+def build_compact_forest(fit_forest, max_bytes, max_leaf_nodes, min_trees=5, min_leaf_nodes=8):
+    """
+    Fit with fit_forest(max_leaf_nodes) and compact the result, dropping
+    trees and then halving the leaf budget until it fits in max_bytes.
+    Returns (compact model, fitted forest, max_leaf_nodes used); the compact
+    model may still exceed max_bytes if even the smallest forest does not fit.
+    """
+    while True:
+        forest = fit_forest(max_leaf_nodes)
+        n_trees = len(forest.estimators_)
+        compact = CompactForest(forest)
+        while model_size(compact) > max_bytes and n_trees > min_trees:
+            n_trees = max(min_trees, int(n_trees * 0.75))
+            compact = CompactForest(forest, n_trees)
+        if model_size(compact) <= max_bytes or max_leaf_nodes <= min_leaf_nodes:
+            return compact, forest, max_leaf_nodes
+        max_leaf_nodes = max(min_leaf_nodes, max_leaf_nodes // 2)
+
+
+def benchmark_model(model, X_test, y_test, repeats=50):
+    """Accuracy, pickled size and single / batched prediction latency for one model"""
+    X_test = np.asarray(X_test)
+    accuracy = float((model.predict(X_test) == np.asarray(y_test)).mean())
+
+    single = X_test[:1]
+    started = time.perf_counter()
+    for _ in range(repeats):
+        model.predict_proba(single)
+    single_ms = (time.perf_counter() - started) / repeats * 1000
+
+    started = time.perf_counter()
+    model.predict_proba(X_test)
+    batch_ms = (time.perf_counter() - started) / max(len(X_test), 1) * 1000
+
+    return {
+        'accuracy': round(accuracy * 100, 2),
+        'size_bytes': model_size(model),
+        'latency_ms_single': round(single_ms, 4),
+        'latency_ms_per_row_batched': round(batch_ms, 4)
+    }
@@ -0,0 +1,283 @@
+"""
+Server-Sent Events hub for pushing per-user updates.
+
+All SSE connections are served by one asyncio event loop running on a
+single background thread, so thousands of idle subscribers cost a socket
+and a small queue each rather than a thread. Flask request and worker
+threads call publish(), which hands the message to the loop thread-safely.
+
+Clients connect with GET /events/<email>; a comment line is sent every
+HEARTBEAT_SECONDS to keep proxies from closing idle streams.
+
+With several worker processes only one of them can bind the port; it owns
+every subscriber. The other workers forward their events to it over
+loopback (POST /publish, GET /topics), and if the owner goes away the next
+worker that fails to forward takes the port over. Those internal requests
+carry a secret shared by the workers in an X-Internal-Token header, since a
+reverse proxy on the same host makes every outside client look local.
+"""
+import asyncio
+import errno
+import hmac
+import http.client
+import json
+import os
+import secrets
+import threading
+from urllib.parse import unquote
+
+HEARTBEAT_SECONDS = 15
+SUBSCRIBER_QUEUE_SIZE = 8
+MAX_REQUEST_HEADER_BYTES = 8192
+MAX_PUBLISH_BYTES = 1024 * 1024
+FORWARD_TIMEOUT_SECONDS = 2
+INTERNAL_TOKEN_HEADER = 'x-internal-token'
+
+
+def shared_secret(path):
+    """
+    Secret read from path, created there on first use. The file is linked
+    into place only once fully written, so concurrently starting workers
+    all end up with the same value.
+    """
+    if not os.path.exists(path):
+        tmp_path = f'{path}.{os.getpid()}.tmp'
+        fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, 'w') as f:
+            f.write(secrets.token_hex(32))
+        try:
+            os.link(tmp_path, path)
+        except FileExistsError:
+            pass
+        finally:
+            os.remove(tmp_path)
+    with open(path, 'r') as f:
+        return f.read().strip()
+
+
+class EventHub:
+    """Registry of SSE subscribers keyed by topic (user email)"""
+
+    def __init__(self, can_subscribe=None, on_subscribe=None, secret=None):
+        # can_subscribe(topic) -> bool and on_subscribe(topic) run on the
+        # event loop and must be quick; on_subscribe typically schedules work.
+        # Without a secret the internal endpoints are disabled.
+        self.secret = secret
+        self.can_subscribe = can_subscribe or (lambda topic: True)
+        self.on_subscribe = on_subscribe
+        self.loop = None
+        self.subscribers = {}
+        self._lock = threading.Lock()
+        self._start_lock = threading.Lock()
+        self._started = None
+        self.start_error = None
+        self.address = None
+        self.forwarding = False
+
+    @property
+    def running(self):
+        """Whether this process owns the listener"""
+        return self.loop is not None and self.loop.is_running()
+
+    @property
+    def available(self):
+        """Whether events published here reach subscribers (owned or forwarded)"""
+        return self.running or self.forwarding
+
+    def topics(self):
+        """Topics with at least one connected subscriber (safe from any thread)"""
+        if not self.running and self.forwarding:
+            body = self._forward('GET', '/topics')
+            return json.loads(body) if body is not None else []
+        with self._lock:
+            return [topic for topic, queues in self.subscribers.items() if queues]
+
+    def subscriber_count(self):
+        with self._lock:
+            return sum(len(queues) for queues in self.subscribers.values())
+
+    def publish(self, topic, event, data):
+        """Queue an event for every subscriber of topic; callable from any thread"""
+        if not self.running and self.forwarding:
+            body = json.dumps({'topic': topic, 'event': event, 'data': data}, default=str).encode()
+            self._forward('POST', '/publish', body)
+            return
+        if self.running:
+            self._publish_local(topic, event, data)
+
+    def _publish_local(self, topic, event, data):
+        message = f'event: {event}\ndata: {json.dumps(data, default=str)}\n\n'.encode()
+        self.loop.call_soon_threadsafe(self._deliver, topic, message)
+
+    def _forward(self, method, path, body=None):
+        """Send a request to the owning process; take the port over if it is gone"""
+        host, port = self.address
+        if host in ('', '0.0.0.0', '::'):
+            host = '127.0.0.1'
+        connection = http.client.HTTPConnection(host, port, timeout=FORWARD_TIMEOUT_SECONDS)
+        try:
+            connection.request(method, path, body=body, headers={
+                'Content-Type': 'application/json',
+                INTERNAL_TOKEN_HEADER: self.secret or ''
+            })
+            response = connection.getresponse()
+            return response.read() if response.status == 200 else None
+        except ConnectionRefusedError:
+            if self.start(*self.address) and body is not None:
+                message = json.loads(body)
+                self._publish_local(message['topic'], message['event'], message['data'])
+            return None
+        except OSError:
+            return None
+        finally:
+            connection.close()
+
+    def _deliver(self, topic, message):
+        with self._lock:
+            queues = list(self.subscribers.get(topic, ()))
+        for queue in queues:
+            if queue.full():
+                # Slow client: drop the oldest update, the newest one supersedes it
+                queue.get_nowait()
+            queue.put_nowait(message)
+
+    def start(self, host, port):
+        """
+        Listen on host:port on an event loop thread. If another process
+        already owns the port, forward events to it instead. Returns True
+        when this process owns the listener.
+        """
+        with self._start_lock:
+            if self.running:
+                return True
+            self.address = (host, port)
+            self.start_error = None
+            self._started = threading.Event()
+            thread = threading.Thread(target=self._run, args=(host, port), name='sse-hub', daemon=True)
+            thread.start()
+            self._started.wait()
+            self.forwarding = getattr(self.start_error, 'errno', None) == errno.EADDRINUSE
+            return self.start_error is None
+
+    def _run(self, host, port):
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        try:
+            loop.run_until_complete(asyncio.start_server(self._handle, host, port))
+        except OSError as e:
+            self.start_error = e
+            self._started.set()
+            return
+        self.loop = loop
+        loop.call_soon(self._started.set)
+        loop.run_forever()
+
+    async def _handle(self, reader, writer):
+        try:
+            request_line = await reader.readline()
+            headers_size = 0
+            content_length = 0
+            token = ''
+            while True:
+                line = await reader.readline()
+                headers_size += len(line)
+                if line in (b'\r\n', b'\n', b'') or headers_size > MAX_REQUEST_HEADER_BYTES:
+                    break
+                name, _, value = line.decode('latin-1').partition(':')
+                name, value = name.strip().lower(), value.strip()
+                if name == 'content-length' and value.isdigit():
+                    content_length = int(value)
+                elif name == INTERNAL_TOKEN_HEADER:
+                    token = value
+
+            parts = request_line.decode('latin-1').split()
+            method, path = (parts[0], parts[1]) if len(parts) >= 2 else ('', '')
+            path = path.split('?', 1)[0]
+
+            if path in ('/publish', '/topics'):
+                await self._handle_internal(reader, writer, method, path, content_length, token)
+                return
+            if method == 'OPTIONS':
+                await self._respond(writer, '204 No Content', b'')
+                return
+            if method != 'GET' or not path.startswith('/events/'):
+                await self._respond(writer, '404 Not Found', b'{"error": "Not found"}')
+                return
+            topic = unquote(path[len('/events/'):])
+            if not self.can_subscribe(topic):
+                await self._respond(writer, '404 Not Found', b'{"error": "User not found"}')
+                return
+
+            await self._stream(topic, writer)
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def _handle_internal(self, reader, writer, method, path, content_length, token):
+        """Events forwarded by other worker processes; need this host and the shared secret"""
+        peer = (writer.get_extra_info('peername') or ('',))[0]
+        local = (writer.get_extra_info('sockname') or ('',))[0]
+        if (not self.secret or not hmac.compare_digest(token.encode(), self.secret.encode())
+                or peer not in ('127.0.0.1', '::1', local)):
+            await self._respond(writer, '403 Forbidden', b'{"error": "Forbidden"}')
+            return
+        if method == 'GET' and path == '/topics':
+            await self._respond(writer, '200 OK', json.dumps(self.topics()).encode())
+            return
+        if method != 'POST' or not 0 < content_length <= MAX_PUBLISH_BYTES:
+            await self._respond(writer, '400 Bad Request', b'{"error": "Bad request"}')
+            return
+        try:
+            message = json.loads(await reader.readexactly(content_length))
+            topic, event, data = message['topic'], message['event'], message['data']
+        except (ValueError, KeyError, TypeError):
+            await self._respond(writer, '400 Bad Request', b'{"error": "Bad request"}')
+            return
+        self._deliver(topic, f'event: {event}\ndata: {json.dumps(data)}\n\n'.encode())
+        await self._respond(writer, '200 OK', b'{"success": true}')
+
+    async def _respond(self, writer, status, body):
+        writer.write(
+            f'HTTP/1.1 {status}\r\n'
+            'Content-Type: application/json\r\n'
+            f'Content-Length: {len(body)}\r\n'
+            'Access-Control-Allow-Origin: *\r\n'
+            'Access-Control-Allow-Methods: GET, OPTIONS\r\n'
+            'Access-Control-Allow-Headers: Cache-Control, Last-Event-ID\r\n'
+            'Connection: close\r\n\r\n'.encode() + body
+        )
+        await writer.drain()
+
+    async def _stream(self, topic, writer):
+        queue = asyncio.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+        with self._lock:
+            self.subscribers.setdefault(topic, set()).add(queue)
+        try:
+            writer.write(
+                b'HTTP/1.1 200 OK\r\n'
+                b'Content-Type: text/event-stream\r\n'
+                b'Cache-Control: no-cache\r\n'
+                b'Connection: keep-alive\r\n'
+                b'X-Accel-Buffering: no\r\n'
+                b'Access-Control-Allow-Origin: *\r\n\r\n'
+                b'retry: 5000\n\n'
+            )
+            await writer.drain()
+            if self.on_subscribe:
+                self.on_subscribe(topic)
+
+            while True:
+                try:
+                    message = await asyncio.wait_for(queue.get(), timeout=HEARTBEAT_SECONDS)
+                except asyncio.TimeoutError:
+                    message = b': keepalive\n\n'
+                writer.write(message)
+                await writer.drain()
+        finally:
+            with self._lock:
+                queues = self.subscribers.get(topic)
+                if queues is not None:
+                    queues.discard(queue)
+                    if not queues:
+                        del self.subscribers[topic]
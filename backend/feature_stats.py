@@ -0,0 +1,443 @@
+"""
+Constant-memory streaming statistics for model inputs, and drift checks
+against the statistics of the data the model was trained on.
+
+Each feature keeps running moments (Welford) and a relative-error quantile
+sketch (log-spaced buckets, DDSketch style); labels are plain counters.
+Every update is O(1), and all of it can be serialized and merged, so each
+worker process keeps its own monitor and they are combined when read.
+"""
+import glob
+import json
+import math
+import os
+import threading
+import time
+import uuid
+import zlib
+
+# Relative accuracy of the quantile sketch and cap on its bucket count
+SKETCH_ALPHA = 0.01
+SKETCH_MAX_BUCKETS = 2048
+REPORT_QUANTILES = (0.01, 0.1, 0.25, 0.5, 0.75, 0.9, 0.99)
+# Population stability index thresholds
+PSI_WARNING = 0.1
+PSI_DRIFT = 0.25
+MIN_LIVE_SAMPLES = 30
+
+
+class RunningStats:
+    """Count, mean, variance, min and max with Welford updates and Chan merges"""
+
+    def __init__(self, count=0, mean=0.0, m2=0.0, min=math.inf, max=-math.inf):
+        self.count = count
+        self.mean = mean
+        self.m2 = m2
+        self.min = min
+        self.max = max
+
+    def add(self, value):
+        self.count += 1
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (value - self.mean)
+        self.min = min(self.min, value)
+        self.max = max(self.max, value)
+
+    def merge(self, other):
+        if not other.count:
+            return
+        total = self.count + other.count
+        delta = other.mean - self.mean
+        self.mean += delta * other.count / total
+        self.m2 += other.m2 + delta * delta * self.count * other.count / total
+        self.count = total
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+
+    @property
+    def std(self):
+        return math.sqrt(self.m2 / (self.count - 1)) if self.count > 1 else 0.0
+
+    def to_dict(self):
+        return {'count': self.count, 'mean': self.mean, 'm2': self.m2,
+                'min': self.min if self.count else None, 'max': self.max if self.count else None}
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data['count'], data['mean'], data['m2'],
+                   math.inf if data['min'] is None else data['min'],
+                   -math.inf if data['max'] is None else data['max'])
+
+
+class QuantileSketch:
+    """Mergeable quantile sketch with bounded relative error on positive values"""
+
+    def __init__(self, alpha=SKETCH_ALPHA, buckets=None, zero_count=0, negative=None):
+        self.alpha = alpha
+        self.gamma = (1 + alpha) / (1 - alpha)
+        self.log_gamma = math.log(self.gamma)
+        self.buckets = buckets or {}
+        self.negative = negative or {}
+        self.zero_count = zero_count
+
+    @property
+    def count(self):
+        return self.zero_count + sum(self.buckets.values()) + sum(self.negative.values())
+
+    def _key(self, value):
+        return math.ceil(math.log(value) / self.log_gamma)
+
+    def _value(self, key):
+        return 2 * self.gamma ** key / (self.gamma + 1)
+
+    def add(self, value):
+        if value > 0:
+            key = self._key(value)
+            self.buckets[key] = self.buckets.get(key, 0) + 1
+            if len(self.buckets) > SKETCH_MAX_BUCKETS:
+                self._collapse(self.buckets)
+        elif value < 0:
+            key = self._key(-value)
+            self.negative[key] = self.negative.get(key, 0) + 1
+            if len(self.negative) > SKETCH_MAX_BUCKETS:
+                self._collapse(self.negative)
+        else:
+            self.zero_count += 1
+
+    def _collapse(self, buckets):
+        """Fold the two smallest-magnitude buckets together to stay within the cap"""
+        lowest, second = sorted(buckets)[:2]
+        buckets[second] += buckets.pop(lowest)
+
+    def merge(self, other):
+        for key, count in other.buckets.items():
+            self.buckets[key] = self.buckets.get(key, 0) + count
+        for key, count in other.negative.items():
+            self.negative[key] = self.negative.get(key, 0) + count
+        self.zero_count += other.zero_count
+        while len(self.buckets) > SKETCH_MAX_BUCKETS:
+            self._collapse(self.buckets)
+        while len(self.negative) > SKETCH_MAX_BUCKETS:
+            self._collapse(self.negative)
+
+    def _ordered(self):
+        """(value, count) pairs in ascending value order"""
+        for key in sorted(self.negative, reverse=True):
+            yield -self._value(key), self.negative[key]
+        if self.zero_count:
+            yield 0.0, self.zero_count
+        for key in sorted(self.buckets):
+            yield self._value(key), self.buckets[key]
+
+    def quantile(self, q):
+        total = self.count
+        if not total:
+            return None
+        rank = q * (total - 1)
+        seen = 0
+        for value, count in self._ordered():
+            seen += count
+            if seen > rank:
+                return value
+        return value
+
+    def cdf(self, x):
+        """Fraction of values <= x"""
+        total = self.count
+        if not total:
+            return 0.0
+        below = 0
+        for value, count in self._ordered():
+            if value > x:
+                break
+            below += count
+        return below / total
+
+    def to_dict(self):
+        return {'alpha': self.alpha, 'zero_count': self.zero_count,
+                'buckets': {str(k): v for k, v in self.buckets.items()},
+                'negative': {str(k): v for k, v in self.negative.items()}}
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data['alpha'], {int(k): v for k, v in data['buckets'].items()},
+                   data['zero_count'], {int(k): v for k, v in data['negative'].items()})
+
+
+def population_stability_index(expected, actual):
+    """PSI between two lists of bin fractions"""
+    psi = 0.0
+    for e, a in zip(expected, actual):
+        e = max(e, 1e-4)
+        a = max(a, 1e-4)
+        psi += (a - e) * math.log(a / e)
+    return psi
+
+
+def drift_status(psi):
+    if psi is None:
+        return 'insufficient_data'
+    if psi >= PSI_DRIFT:
+        return 'drift'
+    if psi >= PSI_WARNING:
+        return 'warning'
+    return 'ok'
+
+
+class FeatureMonitor:
+    """Streaming per-feature moments and quantiles plus label counts"""
+
+    def __init__(self, features, snapshot_id=None):
+        self.features = list(features)
+        self.snapshot_id = snapshot_id
+        self.stats = {f: RunningStats() for f in self.features}
+        self.sketches = {f: QuantileSketch() for f in self.features}
+        self.labels = {}
+        self.samples = 0
+        self.lock = threading.Lock()
+
+    def update(self, record, label=None):
+        """Add one input row (a dict with the feature values) and optionally its label"""
+        with self.lock:
+            self.samples += 1
+            for feature in self.features:
+                try:
+                    value = float(record[feature])
+                except (KeyError, TypeError, ValueError):
+                    continue
+                if math.isfinite(value):
+                    self.stats[feature].add(value)
+                    self.sketches[feature].add(value)
+            if label is not None:
+                self.labels[label] = self.labels.get(label, 0) + 1
+
+    def merge(self, other):
+        with self.lock:
+            self.samples += other.samples
+            for feature in self.features:
+                if feature in other.stats:
+                    self.stats[feature].merge(other.stats[feature])
+                    self.sketches[feature].merge(other.sketches[feature])
+            for label, count in other.labels.items():
+                self.labels[label] = self.labels.get(label, 0) + count
+
+    def copy(self):
+        return FeatureMonitor.from_dict(self.to_dict())
+
+    def to_dict(self):
+        with self.lock:
+            return {
+                'snapshot_id': self.snapshot_id,
+                'samples': self.samples,
+                'features': {f: {'stats': self.stats[f].to_dict(), 'sketch': self.sketches[f].to_dict()}
+                             for f in self.features},
+                'labels': dict(self.labels)
+            }
+
+    @classmethod
+    def from_dict(cls, data):
+        monitor = cls(data['features'].keys(), data.get('snapshot_id'))
+        monitor.samples = data['samples']
+        for feature, state in data['features'].items():
+            monitor.stats[feature] = RunningStats.from_dict(state['stats'])
+            monitor.sketches[feature] = QuantileSketch.from_dict(state['sketch'])
+        monitor.labels = dict(data['labels'])
+        return monitor
+
+    @classmethod
+    def from_rows(cls, features, rows, labels=None, snapshot_id=None):
+        """Build a monitor from training rows (iterables of feature values)"""
+        monitor = cls(features, snapshot_id)
+        labels = labels if labels is not None else [None] * len(rows)
+        for row, label in zip(rows, labels):
+            monitor.update(dict(zip(features, row)), label)
+        return monitor
+
+    def summary(self, feature):
+        stats = self.stats[feature]
+        sketch = self.sketches[feature]
+        return {
+            'count': stats.count,
+            'mean': round(stats.mean, 4) if stats.count else None,
+            'std': round(stats.std, 4) if stats.count else None,
+            'min': stats.min if stats.count else None,
+            'max': stats.max if stats.count else None,
+            'quantiles': {f'p{int(q * 100)}': (round(sketch.quantile(q), 4) if stats.count else None)
+                          for q in REPORT_QUANTILES}
+        }
+
+    def compare(self, reference):
+        """Drift of this (live) monitor against a training-time reference monitor"""
+        report = {'samples': self.samples, 'features': {}}
+        for feature in self.features:
+            live = self.summary(feature)
+            entry = {'live': live}
+            if reference is not None and feature in reference.features:
+                ref_stats = reference.stats[feature]
+                ref_sketch = reference.sketches[feature]
+                entry['training'] = reference.summary(feature)
+                psi = mean_shift = None
+                if live['count'] >= MIN_LIVE_SAMPLES and ref_stats.count:
+                    # Compare mass in the training deciles
+                    edges = [ref_sketch.quantile(q / 10) for q in range(1, 10)]
+                    expected = _bin_fractions(ref_sketch, edges)
+                    actual = _bin_fractions(self.sketches[feature], edges)
+                    psi = round(population_stability_index(expected, actual), 4)
+                    if ref_stats.std > 0:
+                        mean_shift = round((self.stats[feature].mean - ref_stats.mean) / ref_stats.std, 4)
+                entry['psi'] = psi
+                entry['mean_shift_std'] = mean_shift
+                entry['status'] = drift_status(psi)
+            report['features'][feature] = entry
+
+        report['labels'] = {'live': dict(self.labels)}
+        if reference is not None and reference.labels:
+            report['labels']['training'] = dict(reference.labels)
+            live_total = sum(self.labels.values())
+            if live_total >= MIN_LIVE_SAMPLES:
+                ref_total = sum(reference.labels.values())
+                classes = sorted(set(reference.labels) | set(self.labels))
+                psi = population_stability_index(
+                    [reference.labels.get(c, 0) / ref_total for c in classes],
+                    [self.labels.get(c, 0) / live_total for c in classes]
+                )
+                report['labels']['psi'] = round(psi, 4)
+                report['labels']['status'] = drift_status(psi)
+            else:
+                report['labels']['status'] = drift_status(None)
+        return report
+
+
+def _bin_fractions(sketch, edges):
+    cumulative = [sketch.cdf(edge) for edge in edges] + [1.0]
+    fractions = []
+    previous = 0.0
+    for value in cumulative:
+        fractions.append(max(0.0, value - previous))
+        previous = value
+    return fractions
+
+
+class WorkerStatsStore:
+    """
+    Shares each worker process's live monitor through one file per process,
+    so any worker can report statistics merged across all of them.
+
+    File names carry the PID and a random token, so a reused PID never
+    overwrites another process's data. A live worker touches its file every
+    stale_seconds / 3; files older than stale_seconds belong to processes
+    that are gone and are deleted instead of merged.
+    """
+
+    def __init__(self, directory, flush_every=200, flush_seconds=30, stale_seconds=300):
+        self.directory = directory
+        self.flush_every = flush_every
+        self.flush_seconds = flush_seconds
+        self.stale_seconds = stale_seconds
+        self.path = os.path.join(directory, f'worker-{os.getpid()}-{uuid.uuid4().hex[:8]}.json')
+        self._pending = 0
+        self._last_flush = time.monotonic()
+        self._heartbeat = None
+        self._cache = (None, None)  # (other workers' file list, their merged monitor)
+        self.lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def maybe_flush(self, monitor):
+        """Count an update and write this worker's state when enough has accumulated"""
+        with self.lock:
+            self._pending += 1
+            if self._pending >= self.flush_every or time.monotonic() - self._last_flush >= self.flush_seconds:
+                self._flush(monitor)
+
+    def flush(self, monitor):
+        with self.lock:
+            self._flush(monitor)
+
+    def _flush(self, monitor):
+        self._pending = 0
+        self._last_flush = time.monotonic()
+        tmp_path = f'{self.path}.{uuid.uuid4().hex[:8]}.tmp'
+        try:
+            with open(tmp_path, 'w') as f:
+                json.dump(monitor.to_dict(), f)
+            os.replace(tmp_path, self.path)
+        except OSError:
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+            raise
+        if self._heartbeat is None:
+            self._heartbeat = threading.Thread(target=self._beat, name='feature-stats-heartbeat', daemon=True)
+            self._heartbeat.start()
+
+    def _beat(self):
+        while True:
+            time.sleep(self.stale_seconds / 3)
+            try:
+                os.utime(self.path)
+            except OSError:
+                pass  # removed by reset(); written again on the next flush
+
+    def other_files(self):
+        """
+        (path, mtime_ns, size) of the other workers' live files; cheap enough
+        to serve as a version of the merged statistics. Stale files are deleted.
+        """
+        now = time.time()
+        files = []
+        try:
+            entries = list(os.scandir(self.directory))
+        except OSError:
+            return files
+        for entry in entries:
+            if not (entry.name.startswith('worker-') and entry.name.endswith('.json')) or entry.path == self.path:
+                continue
+            try:
+                stat = entry.stat()
+            except OSError:
+                continue
+            if now - stat.st_mtime > self.stale_seconds:
+                try:
+                    os.remove(entry.path)
+                except OSError:
+                    pass
+                continue
+            files.append((entry.path, stat.st_mtime_ns, stat.st_size))
+        files.sort()
+        return files
+
+    def version(self, monitor, files):
+        """Changes whenever the merged statistics may have changed"""
+        return f"{monitor.samples}-{zlib.crc32(repr(files).encode()):08x}"
+
+    def merged(self, monitor, files=None):
+        """This worker's in-memory monitor merged with the other workers' latest files"""
+        files = self.other_files() if files is None else files
+        cached_files, others = self._cache
+        if cached_files != files or others is None or others.snapshot_id != monitor.snapshot_id:
+            others = FeatureMonitor(monitor.features, monitor.snapshot_id)
+            for path, _, _ in files:
+                try:
+                    with open(path, 'r') as f:
+                        other = FeatureMonitor.from_dict(json.load(f))
+                except (OSError, ValueError, KeyError):
+                    continue
+                if other.snapshot_id == monitor.snapshot_id:
+                    others.merge(other)
+            self._cache = (files, others)
+        merged = monitor.copy()
+        merged.merge(others)
+        return merged
+
+    def reset(self):
+        """Remove every worker's files, e.g. after a new model changes the reference"""
+        with self.lock:
+            for path in glob.glob(os.path.join(self.directory, 'worker-*.json')):
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+            self._pending = 0
+            self._cache = (None, None)
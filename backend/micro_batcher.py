@@ -0,0 +1,102 @@
+"""
+Dynamic micro-batching for single-sample model calls.
+
+Concurrent callers submit one item each; a dispatcher thread coalesces them
+for up to ``max_wait_ms`` or ``max_batch_size`` items, hands the whole batch
+to ``batch_fn`` on an executor and fans the results back out to each
+caller's Future. At most ``max_inflight`` batches run at once: while every
+slot is busy the dispatcher stops collecting, so queued items grow into
+larger batches instead of piling up as small ones in the executor queue.
+"""
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+
+class MicroBatcher:
+    """Coalesce concurrent single-item calls into vectorized batch calls"""
+
+    def __init__(self, batch_fn, executor, max_batch_size=32, max_wait_ms=5.0, max_inflight=1):
+        self.batch_fn = batch_fn
+        self.executor = executor
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.max_wait = max(0.0, float(max_wait_ms)) / 1000.0
+        self.max_inflight = max(1, int(max_inflight))
+        self._slots = threading.Semaphore(self.max_inflight)
+
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._batches = 0
+        self._items = 0
+        self._largest_batch = 0
+
+        self._thread = threading.Thread(target=self._dispatch_loop, name='ml-batcher', daemon=True)
+        self._thread.start()
+
+    def submit(self, item):
+        """Queue one item for scoring and return a Future for its result"""
+        future = Future()
+        self._queue.put((item, future))
+        return future
+
+    def stats(self):
+        """Batching counters for monitoring"""
+        with self._lock:
+            return {
+                'max_batch_size': self.max_batch_size,
+                'max_wait_ms': round(self.max_wait * 1000, 2),
+                'max_inflight': self.max_inflight,
+                'batches': self._batches,
+                'items': self._items,
+                'avg_batch_size': round(self._items / self._batches, 2) if self._batches else 0,
+                'largest_batch': self._largest_batch,
+                'queued': self._queue.qsize()
+            }
+
+    def _collect(self):
+        """Block for the first item, then gather more until the batch is full or the wait expires"""
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.max_wait
+
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                if remaining > 0:
+                    batch.append(self._queue.get(timeout=remaining))
+                else:
+                    batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _dispatch_loop(self):
+        while True:
+            # Wait for a free slot first; meanwhile submissions keep queueing
+            self._slots.acquire()
+            batch = self._collect()
+            with self._lock:
+                self._batches += 1
+                self._items += len(batch)
+                self._largest_batch = max(self._largest_batch, len(batch))
+            try:
+                self.executor.submit(self._score, batch)
+            except RuntimeError as e:
+                # Executor shut down (interpreter exit); fail the waiting callers
+                self._slots.release()
+                for _, future in batch:
+                    future.set_exception(e)
+
+    def _score(self, batch):
+        items = [item for item, _ in batch]
+        try:
+            results = self.batch_fn(items)
+        except Exception as e:
+            for _, future in batch:
+                future.set_exception(e)
+            return
+        finally:
+            self._slots.release()
+
+        for (_, future), result in zip(batch, results):
+            future.set_result(result)
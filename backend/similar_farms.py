@@ -0,0 +1,379 @@
+"""
+"Similar farms" nearest-neighbour search over soil profiles.
+
+Profiles come from two places: reference samples in the training set (real
+agricultural data with yield and state, and manual entries) and the latest
+soil_data of each user. Their N/P/K/pH/moisture values are standardized and
+stored in a KD-tree. The tree is immutable, so changes (new samples, users
+updating their soil data, deleted users) are kept in a small pending set
+that is searched by brute force next to the tree. Once the pending set
+reaches rebuild_threshold, a background thread compacts everything into a
+fresh tree and swaps it in.
+
+Queries filtered by state or crop use per-value row lists. A filter that
+matches few rows is answered by brute force over those rows; otherwise the
+tree is searched with a growing k until enough rows pass the filter.
+
+numpy and scikit-learn are imported on first build, so importing this
+module stays cheap.
+"""
+import math
+import threading
+import time
+from collections import OrderedDict
+
+from user_fields import normalize, user_region
+
+FEATURES = ('nitrogen', 'phosphorus', 'potassium', 'ph', 'moisture')
+KINDS = ('reference', 'farm')
+
+
+def _point(record):
+    """Feature values of a record, or None if any is missing or not a finite number"""
+    try:
+        point = [float(record[feature]) for feature in FEATURES]
+    except (KeyError, TypeError, ValueError):
+        return None
+    return point if all(math.isfinite(value) for value in point) else None
+
+
+def sample_profile(profile_id, record):
+    """Profile for a training sample, or None if it lacks soil values"""
+    point = _point(record)
+    if point is None:
+        return None
+    crop_yield = record.get('yield')
+    return {
+        'id': profile_id,
+        'kind': 'reference',
+        'point': point,
+        'crop': record.get('crop'),
+        'state': record.get('state'),
+        'yield': float(crop_yield) if isinstance(crop_yield, (int, float)) else None
+    }
+
+
+def user_profile(email, user):
+    """Profile for a user's latest soil data, or None if it is incomplete"""
+    point = _point(user.get('soil_data') or {})
+    if point is None:
+        return None
+    return {
+        'id': f'user:{email}',
+        'kind': 'farm',
+        'point': point,
+        'crop': user.get('cropType'),
+        'state': user_region(user),
+        'yield': None
+    }
+
+
+class Vocabulary:
+    """Case-insensitive value <-> integer code mapping (code -1 means missing)"""
+
+    def __init__(self):
+        self.codes = {}
+        self.names = []
+        self.lock = threading.Lock()
+
+    def code(self, value, add=True):
+        """Code of value; a new code is assigned if add, otherwise None is returned for unknown values"""
+        key = normalize(value)
+        if key is None:
+            return -1
+        with self.lock:
+            code = self.codes.get(key)
+            if code is None and add:
+                code = self.codes[key] = len(self.names)
+                self.names.append(str(value).strip())
+            return code
+
+    def name(self, code):
+        return self.names[code] if code >= 0 else None
+
+
+class ProfileRows:
+    """Column arrays for a set of profiles"""
+
+    COLUMNS = ('ids', 'kinds', 'raw', 'crops', 'states', 'yields')
+
+    def __init__(self, ids, kinds, raw, crops, states, yields):
+        self.ids = ids
+        self.kinds = kinds
+        self.raw = raw
+        self.crops = crops
+        self.states = states
+        self.yields = yields
+
+    def __len__(self):
+        return len(self.ids)
+
+    @classmethod
+    def from_profiles(cls, profiles, crop_vocab, state_vocab):
+        import numpy as np
+        profiles = [profile for profile in profiles if profile is not None]
+        return cls(
+            ids=np.array([profile['id'] for profile in profiles], dtype=object),
+            kinds=np.array([KINDS.index(profile['kind']) for profile in profiles], dtype=np.int8),
+            raw=np.array([profile['point'] for profile in profiles], dtype=np.float32).reshape(-1, len(FEATURES)),
+            crops=np.array([crop_vocab.code(profile['crop']) for profile in profiles], dtype=np.int32),
+            states=np.array([state_vocab.code(profile['state']) for profile in profiles], dtype=np.int32),
+            yields=np.array([np.nan if profile['yield'] is None else profile['yield'] for profile in profiles],
+                            dtype=np.float32)
+        )
+
+    def select(self, mask):
+        return ProfileRows(*(getattr(self, column)[mask] for column in self.COLUMNS))
+
+    def concat(self, other):
+        import numpy as np
+        return ProfileRows(*(np.concatenate([getattr(self, column), getattr(other, column)])
+                             for column in self.COLUMNS))
+
+
+class FarmGeneration(ProfileRows):
+    """Profile rows indexed by one immutable KD-tree"""
+
+    def __init__(self, rows, mean=None, std=None, leaf_size=40):
+        import numpy as np
+        from sklearn.neighbors import KDTree
+
+        super().__init__(*(getattr(rows, column) for column in self.COLUMNS))
+        if mean is None:
+            mean = self.raw.mean(axis=0) if len(self) else np.zeros(len(FEATURES))
+            std = self.raw.std(axis=0) if len(self) else np.ones(len(FEATURES))
+            std = np.where(std > 1e-9, std, 1.0)
+        self.mean = np.asarray(mean, dtype=np.float64)
+        self.std = np.asarray(std, dtype=np.float64)
+        self.tree = KDTree(self.scale(self.raw), leaf_size=leaf_size) if len(self) else None
+        self.scaled = np.asarray(self.tree.get_arrays()[0]) if self.tree is not None else np.empty((0, len(FEATURES)))
+        self.rows_by_crop = self._group(self.crops)
+        self.rows_by_state = self._group(self.states)
+
+    def scale(self, points):
+        import numpy as np
+        return (np.asarray(points, dtype=np.float64) - self.mean) / self.std
+
+    @staticmethod
+    def _group(codes):
+        """code -> row indices with that code, from one stable sort"""
+        import numpy as np
+        order = np.argsort(codes, kind='stable')
+        values, starts = np.unique(codes[order], return_index=True)
+        return {int(v): rows for v, rows in zip(values, np.split(order, starts[1:])) if v >= 0}
+
+    def compacted(self, changes, crop_vocab, state_vocab):
+        """A new generation with changes (id -> profile or None) applied, on the same scale"""
+        import numpy as np
+        keep = np.fromiter((profile_id not in changes for profile_id in self.ids), dtype=bool, count=len(self))
+        added = ProfileRows.from_profiles(changes.values(), crop_vocab, state_vocab)
+        return FarmGeneration(self.select(keep).concat(added), self.mean, self.std)
+
+
+class SimilarFarmIndex:
+    """KD-tree over all soil profiles plus a brute-force searched set of pending changes"""
+
+    def __init__(self, load_profiles, rebuild_threshold=2000, brute_force_limit=20000):
+        # load_profiles() -> iterable of profiles; used for the initial build
+        self.load_profiles = load_profiles
+        self.rebuild_threshold = max(1, int(rebuild_threshold))
+        self.brute_force_limit = int(brute_force_limit)
+        self.crop_vocab = Vocabulary()
+        self.state_vocab = Vocabulary()
+        self.generation = None
+        self.changes = OrderedDict()  # profile id -> (sequence, profile or None)
+        self.sequence = 0
+        self._pending = None          # cached ProfileRows of pending profiles
+        self.lock = threading.Lock()
+        self.build_lock = threading.Lock()
+        self.ready = threading.Event()
+        self.builds = 0
+        self.last_build_seconds = None
+
+    def upsert(self, profile):
+        if profile is not None:
+            self._change(profile['id'], profile)
+
+    def remove(self, profile_id):
+        self._change(profile_id, None)
+
+    def _change(self, profile_id, profile):
+        with self.lock:
+            self.sequence += 1
+            self.changes.pop(profile_id, None)
+            self.changes[profile_id] = (self.sequence, profile)
+            self._pending = None
+            rebuild = self.generation is not None and len(self.changes) >= self.rebuild_threshold
+        if rebuild:
+            self.start_rebuild()
+
+    def ensure_built(self):
+        """Build the first tree, once; concurrent callers wait for it"""
+        if self.ready.is_set():
+            return
+        with self.build_lock:
+            if not self.ready.is_set():
+                self._build()
+                self.ready.set()
+
+    def start_rebuild(self):
+        """Compact pending changes into a new tree on a background thread"""
+        if not self.ready.is_set() or self.build_lock.locked():
+            return False
+        threading.Thread(target=self._background_build, name='similar-farms-build', daemon=True).start()
+        return True
+
+    def _background_build(self):
+        if self.build_lock.acquire(blocking=False):
+            try:
+                self._build()
+            finally:
+                self.build_lock.release()
+
+    def _build(self):
+        started = time.perf_counter()
+        with self.lock:
+            sequence = self.sequence
+            changes = {profile_id: profile for profile_id, (_, profile) in self.changes.items()}
+            base = self.generation
+
+        if base is None:
+            # Changes made before this point are already in the source data
+            generation = FarmGeneration(ProfileRows.from_profiles(self.load_profiles(), self.crop_vocab, self.state_vocab))
+        else:
+            generation = base.compacted(changes, self.crop_vocab, self.state_vocab)
+
+        with self.lock:
+            self.generation = generation
+            for profile_id in [pid for pid, (seq, _) in self.changes.items() if seq <= sequence]:
+                del self.changes[profile_id]
+            self._pending = None
+            self.builds += 1
+            self.last_build_seconds = round(time.perf_counter() - started, 4)
+
+    def _pending_rows(self):
+        """Rows of pending (added or changed) profiles, and the ids they hide in the tree; call under lock"""
+        if self._pending is None:
+            profiles = [profile for _, profile in self.changes.values()]
+            self._pending = (ProfileRows.from_profiles(profiles, self.crop_vocab, self.state_vocab), set(self.changes))
+        return self._pending
+
+    def query(self, point, k=10, crop=None, state=None, exclude=None):
+        """
+        The k profiles nearest to point (raw feature values in FEATURES
+        order), optionally only those with the given crop and / or state.
+        exclude is a profile id left out of the results (the caller's own).
+        """
+        import numpy as np
+        self.ensure_built()
+        with self.lock:
+            generation = self.generation
+            pending, hidden = self._pending_rows()
+            crop_code = self.crop_vocab.code(crop, add=False) if crop else -1
+            state_code = self.state_vocab.code(state, add=False) if state else -1
+        if crop_code is None or state_code is None:
+            return []
+
+        x = generation.scale([point])[0]
+        hidden = hidden | {exclude} if exclude else hidden
+
+        # Rows of the tree, then pending rows, as (distance, source, row)
+        candidates = [(d, generation, row) for d, row in self._search_tree(generation, x, k, crop_code, state_code, hidden)]
+        if len(pending.ids):
+            mask = np.ones(len(pending.ids), dtype=bool)
+            if crop_code >= 0:
+                mask &= pending.crops == crop_code
+            if state_code >= 0:
+                mask &= pending.states == state_code
+            if exclude:
+                mask &= pending.ids != exclude
+            rows = np.nonzero(mask)[0]
+            distances = np.sqrt(((generation.scale(pending.raw[rows]) - x) ** 2).sum(axis=1))
+            candidates.extend(zip(distances, [pending] * len(rows), rows))
+
+        candidates.sort(key=lambda candidate: candidate[0])
+        return [self._neighbor(source, row, distance) for distance, source, row in candidates[:k]]
+
+    def _search_tree(self, generation, x, k, crop_code, state_code, hidden):
+        import numpy as np
+        if generation.tree is None or k <= 0:
+            return []
+
+        rows = None
+        for code, groups in ((crop_code, generation.rows_by_crop), (state_code, generation.rows_by_state)):
+            if code >= 0:
+                group = groups.get(code)
+                if group is None:
+                    return []
+                rows = group if rows is None or len(group) < len(rows) else rows
+
+        def wanted(row):
+            return ((crop_code < 0 or generation.crops[row] == crop_code)
+                    and (state_code < 0 or generation.states[row] == state_code)
+                    and generation.ids[row] not in hidden)
+
+        if rows is not None and len(rows) <= self.brute_force_limit:
+            # Few matching rows: scanning them beats filtering tree results
+            distances = np.sqrt(((generation.scaled[rows] - x) ** 2).sum(axis=1))
+            order = np.argsort(distances)
+            found = []
+            for i in order:
+                if wanted(rows[i]):
+                    found.append((distances[i], rows[i]))
+                    if len(found) == k:
+                        break
+            return found
+
+        fetch = k + len(hidden)
+        while True:
+            fetch = min(fetch, len(generation))
+            distances, indexes = generation.tree.query(x[None, :], k=fetch)
+            found = [(d, row) for d, row in zip(distances[0], indexes[0]) if wanted(row)]
+            if len(found) >= k or fetch == len(generation):
+                return found[:k]
+            fetch *= 4
+
+    def _neighbor(self, source, row, distance):
+        crop_yield = float(source.yields[row])
+        return {
+            'source': KINDS[source.kinds[row]],
+            'crop': self.crop_vocab.name(int(source.crops[row])),
+            'state': self.state_vocab.name(int(source.states[row])),
+            'yield': None if math.isnan(crop_yield) else round(crop_yield, 2),
+            'distance': round(float(distance), 4),
+            'soil': {feature: round(float(value), 2) for feature, value in zip(FEATURES, source.raw[row])}
+        }
+
+    def stats(self):
+        with self.lock:
+            generation = self.generation
+            return {
+                'ready': self.ready.is_set(),
+                'indexed_profiles': len(generation) if generation is not None else 0,
+                'pending_changes': len(self.changes),
+                'rebuild_threshold': self.rebuild_threshold,
+                'builds': self.builds,
+                'last_build_seconds': self.last_build_seconds
+            }
+
+
+def summarize(neighbors):
+    """Per-crop count, mean distance and mean yield over a neighbour list"""
+    by_crop = {}
+    for neighbor in neighbors:
+        entry = by_crop.setdefault(neighbor['crop'], {'crop': neighbor['crop'], 'count': 0, 'distances': [], 'yields': []})
+        entry['count'] += 1
+        entry['distances'].append(neighbor['distance'])
+        if neighbor['yield'] is not None:
+            entry['yields'].append(neighbor['yield'])
+    summary = []
+    for entry in by_crop.values():
+        summary.append({
+            'crop': entry['crop'],
+            'count': entry['count'],
+            'avg_distance': round(sum(entry['distances']) / entry['count'], 4),
+            'avg_yield': round(sum(entry['yields']) / len(entry['yields']), 2) if entry['yields'] else None,
+            'yield_samples': len(entry['yields'])
+        })
+    summary.sort(key=lambda entry: (-entry['count'], entry['avg_distance']))
+    return summary
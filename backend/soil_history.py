@@ -0,0 +1,310 @@
+"""
+Per-user soil reading history.
+
+Raw readings are kept in fixed-size segments of typed arrays (one array per
+parameter) and rolled up on write into hourly and daily buckets holding
+min / max / sum / count per parameter. Each resolution has its own retention
+window, so long ranges are answered from the rollups without touching raw
+points. Buckets start on local hours and midnights, the same clock the
+timestamps are formatted in.
+
+Every user's series lives under data/soil_history/ rather than in
+users.json, as a snapshot plus an append-only log of the readings taken
+since. A write appends one fixed-size record to the log; once the log holds
+SEGMENT_SIZE readings it is compacted into a new snapshot. Loading replays
+the log onto the snapshot. Writes lock only their own user's stripe, and at
+most MAX_CACHED_SERIES series are kept in memory.
+"""
+import bisect
+import glob
+import hashlib
+import math
+import os
+import pickle
+import struct
+import threading
+import time
+from array import array
+from collections import OrderedDict
+from datetime import datetime
+
+SOIL_PARAMETERS = ('moisture', 'ph', 'nitrogen', 'phosphorus', 'potassium')
+SEGMENT_SIZE = 512
+MAX_CACHED_SERIES = 1000
+LOCK_STRIPES = 64
+# One log record: timestamp followed by every parameter
+LOG_RECORD = struct.Struct('<%dd' % (1 + len(SOIL_PARAMETERS)))
+
+HOUR = 3600
+DAY = 86400
+# resolution -> (bucket seconds, retention seconds)
+RESOLUTIONS = {
+    'raw': (None, 14 * DAY),
+    'hour': (HOUR, 120 * DAY),
+    'day': (DAY, 5 * 365 * DAY)
+}
+# Longest range served at each resolution when resolution=auto
+AUTO_RESOLUTION = (('raw', 2 * DAY), ('hour', 60 * DAY), ('day', None))
+ROLLUP_STATS = ('min', 'max', 'sum', 'count')
+
+
+def _to_float(value):
+    try:
+        value = float(value)
+    except (TypeError, ValueError):
+        return math.nan
+    return value if math.isfinite(value) else math.nan
+
+
+def format_timestamp(ts):
+    return datetime.fromtimestamp(ts).strftime('%Y-%m-%d %H:%M:%S')
+
+
+def bucket_start(ts, bucket_seconds):
+    """Start of the local hour or day containing ts"""
+    local = datetime.fromtimestamp(ts).replace(minute=0, second=0, microsecond=0)
+    if bucket_seconds == DAY:
+        local = local.replace(hour=0)
+    return local.timestamp()
+
+
+def _new_segment():
+    segment = {'t': array('d')}
+    for param in SOIL_PARAMETERS:
+        segment[param] = array('d')
+    return segment
+
+
+def _new_rollup():
+    rollup = {'t': array('d')}
+    for param in SOIL_PARAMETERS:
+        for stat in ROLLUP_STATS:
+            rollup[f'{param}_{stat}'] = array('d')
+    return rollup
+
+
+class SoilSeries:
+    """All readings and rollups for one user"""
+
+    def __init__(self, segments=None, rollups=None, generation=0):
+        self.segments = segments or []
+        self.rollups = rollups or {'hour': _new_rollup(), 'day': _new_rollup()}
+        self.generation = generation  # snapshot number; its log is <name>.<generation>.log
+        self.logged = 0               # readings in the log, not yet in the snapshot
+
+    def to_state(self):
+        return {'segments': self.segments, 'rollups': self.rollups, 'generation': self.generation}
+
+    def append(self, ts, values):
+        self._append_raw(ts, values)
+        for resolution, rollup in self.rollups.items():
+            self._add_to_rollup(rollup, RESOLUTIONS[resolution][0], ts, values)
+
+    def _append_raw(self, ts, values):
+        if self.segments and self.segments[-1]['t'] and ts < self.segments[-1]['t'][0]:
+            # Late reading: insert it into the segment covering its time
+            first_ts = [segment['t'][0] for segment in self.segments]
+            segment = self.segments[max(0, bisect.bisect_right(first_ts, ts) - 1)]
+        else:
+            if not self.segments or len(self.segments[-1]['t']) >= SEGMENT_SIZE:
+                self.segments.append(_new_segment())
+            segment = self.segments[-1]
+        i = bisect.bisect_right(segment['t'], ts)
+        segment['t'].insert(i, ts)
+        for param in SOIL_PARAMETERS:
+            segment[param].insert(i, values[param])
+
+    def _add_to_rollup(self, rollup, bucket_seconds, ts, values):
+        bucket = bucket_start(ts, bucket_seconds)
+        starts = rollup['t']
+        i = bisect.bisect_left(starts, bucket)
+        if i == len(starts) or starts[i] != bucket:
+            starts.insert(i, bucket)
+            for param in SOIL_PARAMETERS:
+                rollup[f'{param}_min'].insert(i, math.inf)
+                rollup[f'{param}_max'].insert(i, -math.inf)
+                rollup[f'{param}_sum'].insert(i, 0.0)
+                rollup[f'{param}_count'].insert(i, 0.0)
+        for param in SOIL_PARAMETERS:
+            value = values[param]
+            if math.isnan(value):
+                continue
+            rollup[f'{param}_min'][i] = min(rollup[f'{param}_min'][i], value)
+            rollup[f'{param}_max'][i] = max(rollup[f'{param}_max'][i], value)
+            rollup[f'{param}_sum'][i] += value
+            rollup[f'{param}_count'][i] += 1
+
+    def apply_retention(self, now):
+        """Drop raw segments and rollup buckets older than their retention window"""
+        raw_cutoff = now - RESOLUTIONS['raw'][1]
+        while len(self.segments) > 1 and (not self.segments[0]['t'] or self.segments[0]['t'][-1] < raw_cutoff):
+            self.segments.pop(0)
+        if self.segments:
+            first = self.segments[0]
+            drop = bisect.bisect_left(first['t'], raw_cutoff)
+            if drop:
+                for column in first.values():
+                    del column[:drop]
+
+        for resolution, rollup in self.rollups.items():
+            drop = bisect.bisect_left(rollup['t'], now - RESOLUTIONS[resolution][1])
+            if drop:
+                for column in rollup.values():
+                    del column[:drop]
+
+    def raw_range(self, start, end, params):
+        result = {'timestamps': []}
+        for param in params:
+            result[param] = []
+        # Skip whole segments outside the range
+        first_ts = [segment['t'][0] if segment['t'] else math.inf for segment in self.segments]
+        first = max(0, bisect.bisect_right(first_ts, start) - 1)
+        for segment in self.segments[first:]:
+            times = segment['t']
+            if not times or times[0] > end:
+                break
+            lo = bisect.bisect_left(times, start)
+            hi = bisect.bisect_right(times, end)
+            result['timestamps'].extend(format_timestamp(ts) for ts in times[lo:hi])
+            for param in params:
+                result[param].extend(None if math.isnan(v) else v for v in segment[param][lo:hi])
+        return result
+
+    def rollup_range(self, resolution, start, end, params):
+        rollup = self.rollups[resolution]
+        bucket_seconds = RESOLUTIONS[resolution][0]
+        lo = bisect.bisect_left(rollup['t'], bucket_start(start, bucket_seconds))
+        hi = bisect.bisect_right(rollup['t'], end)
+
+        result = {'timestamps': [format_timestamp(ts) for ts in rollup['t'][lo:hi]]}
+        for param in params:
+            mins = rollup[f'{param}_min'][lo:hi]
+            maxs = rollup[f'{param}_max'][lo:hi]
+            sums = rollup[f'{param}_sum'][lo:hi]
+            counts = rollup[f'{param}_count'][lo:hi]
+            result[param] = {
+                'min': [v if c else None for v, c in zip(mins, counts)],
+                'max': [v if c else None for v, c in zip(maxs, counts)],
+                'mean': [round(s / c, 4) if c else None for s, c in zip(sums, counts)],
+                'count': [int(c) for c in counts]
+            }
+        return result
+
+
+class SoilHistoryStore:
+    """Soil series loaded from disk on first access; the least recently used are evicted past max_cached"""
+
+    def __init__(self, directory, max_cached=MAX_CACHED_SERIES):
+        self.directory = directory
+        self.max_cached = max_cached
+        self.series = OrderedDict()
+        self.lock = threading.Lock()  # guards the series cache only
+        self.user_locks = [threading.Lock() for _ in range(LOCK_STRIPES)]
+        os.makedirs(directory, exist_ok=True)
+
+    def _name(self, email):
+        return os.path.join(self.directory, hashlib.sha1(email.encode()).hexdigest())
+
+    def _user_lock(self, email):
+        return self.user_locks[hash(email) % LOCK_STRIPES]
+
+    def _get(self, email, create=False):
+        """Cached or loaded series; the caller holds the user's lock"""
+        with self.lock:
+            series = self.series.get(email)
+            if series is not None:
+                self.series.move_to_end(email)
+                return series
+
+        series = self._load(self._name(email))
+        if series is None and create:
+            series = SoilSeries()
+        if series is not None:
+            with self.lock:
+                self.series[email] = series
+                if len(self.series) > self.max_cached:
+                    # Every reading is on disk once recorded, so eviction loses nothing
+                    self.series.popitem(last=False)
+        return series
+
+    def _load(self, name):
+        series = None
+        if os.path.exists(name + '.pkl'):
+            try:
+                with open(name + '.pkl', 'rb') as f:
+                    series = SoilSeries(**pickle.load(f))
+            except Exception:
+                series = None
+        log_path = f'{name}.{series.generation if series else 0}.log'
+        if os.path.exists(log_path):
+            series = series or SoilSeries()
+            with open(log_path, 'rb') as f:
+                data = f.read()
+            # A torn final record from an interrupted write is ignored
+            usable = len(data) - len(data) % LOG_RECORD.size
+            for record in LOG_RECORD.iter_unpack(data[:usable]):
+                series.append(record[0], dict(zip(SOIL_PARAMETERS, record[1:])))
+                series.logged += 1
+            series.apply_retention(time.time())
+        if series is not None:
+            # Logs already folded into the snapshot (left by an interrupted compaction)
+            for path in glob.glob(glob.escape(name) + '.*.log'):
+                generation = path[len(name) + 1:-len('.log')]
+                if generation.isdigit() and int(generation) < series.generation:
+                    os.remove(path)
+        return series
+
+    def _log(self, name, series, ts, values):
+        with open(f'{name}.{series.generation}.log', 'ab') as f:
+            f.write(LOG_RECORD.pack(ts, *(values[param] for param in SOIL_PARAMETERS)))
+        series.logged += 1
+
+    def _compact(self, name, series):
+        """Write a snapshot holding everything logged so far and start a new, empty log"""
+        old_log = f'{name}.{series.generation}.log'
+        series.generation += 1
+        tmp_path = name + '.pkl.tmp'
+        with open(tmp_path, 'wb') as f:
+            pickle.dump(series.to_state(), f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, name + '.pkl')
+        series.logged = 0
+        # The new snapshot no longer refers to the old log
+        if os.path.exists(old_log):
+            os.remove(old_log)
+
+    def record(self, email, soil_data, ts=None):
+        """Append one reading (missing or non-numeric parameters are stored as gaps)"""
+        ts = time.time() if ts is None else ts
+        values = {param: _to_float(soil_data.get(param)) for param in SOIL_PARAMETERS}
+        name = self._name(email)
+        with self._user_lock(email):
+            series = self._get(email, create=True)
+            series.append(ts, values)
+            series.apply_retention(max(ts, time.time()))
+            self._log(name, series, ts, values)
+            if series.logged >= SEGMENT_SIZE:
+                self._compact(name, series)
+
+    def delete(self, email):
+        name = self._name(email)
+        with self._user_lock(email):
+            with self.lock:
+                self.series.pop(email, None)
+            for path in [name + '.pkl'] + glob.glob(glob.escape(name) + '.*.log'):
+                if os.path.exists(path):
+                    os.remove(path)
+
+    def query(self, email, start, end, resolution='auto', params=SOIL_PARAMETERS):
+        """Readings between start and end (epoch seconds) at the given resolution"""
+        if resolution == 'auto':
+            span = end - start
+            resolution = next(name for name, limit in AUTO_RESOLUTION if limit is None or span <= limit)
+        with self._user_lock(email):
+            series = self._get(email)
+            if series is None:
+                series = SoilSeries()
+            if resolution == 'raw':
+                points = series.raw_range(start, end, params)
+            else:
+                points = series.rollup_range(resolution, start, end, params)
+        return resolution, points
@@ -0,0 +1,193 @@
+"""
+In-memory static file serving for the built frontend (dist/).
+
+The dist folder is scanned once into a manifest: content type, ETag and
+any precompressed .br/.gz siblings are worked out up front, small files are
+kept in memory and content-hashed build assets get long-lived immutable
+cache headers. Compressible files the build did not precompress get gzip
+(and brotli, when installed) variants generated at startup; these are
+written to cache_dir under their content hash, so each version of a file is
+compressed once and large bundles are streamed from disk like any other file.
+"""
+import gzip
+import hashlib
+import mimetypes
+import os
+import re
+import tempfile
+
+from flask import Response, send_file
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Vite emits hashed bundles such as assets/index-B4fK2x9a.js
+HASHED_ASSET_RE = re.compile(r'[-.][A-Za-z0-9_-]{8,}\.[A-Za-z0-9]+$')
+COMPRESSIBLE_TYPES = ('text/', 'application/javascript', 'application/json',
+                      'application/xml', 'image/svg+xml', 'application/manifest+json')
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+REVALIDATE_CACHE_CONTROL = 'no-cache'
+PRECOMPRESSED_EXTENSIONS = {'.br': 'br', '.gz': 'gzip'}
+# Preferred order when the client accepts several encodings
+ENCODING_PREFERENCE = ('br', 'gzip')
+
+
+class StaticVariant:
+    """One encoding of a static file, held in memory or read from disk"""
+    __slots__ = ('path', 'size', 'data', 'etag')
+
+    def __init__(self, path, size, data, etag):
+        self.path = path
+        self.size = size
+        self.data = data
+        self.etag = etag
+
+
+class StaticAsset:
+    """A file in dist/ with all of its available encodings"""
+    __slots__ = ('name', 'mimetype', 'cache_control', 'variants')
+
+    def __init__(self, name, mimetype, cache_control):
+        self.name = name
+        self.mimetype = mimetype
+        self.cache_control = cache_control
+        self.variants = {}
+
+
+class StaticAssets:
+    """Manifest of the built frontend, serving files with caching headers"""
+
+    def __init__(self, dist_dir, max_cached_bytes=256 * 1024, index_file='index.html', cache_dir=None):
+        self.dist_dir = os.path.normpath(dist_dir)
+        self.max_cached_bytes = max_cached_bytes
+        self.index_file = index_file
+        self.cache_dir = cache_dir or os.path.join(tempfile.gettempdir(), 'static-assets-cache')
+        self.manifest = {}
+        self.reload()
+
+    @property
+    def available(self):
+        return self.index_file in self.manifest
+
+    def reload(self):
+        """Rescan dist/ and rebuild the manifest"""
+        manifest = {}
+        self._cache_files = set()
+        if os.path.isdir(self.dist_dir):
+            for root, _, files in os.walk(self.dist_dir):
+                for filename in files:
+                    full_path = os.path.join(root, filename)
+                    name = os.path.relpath(full_path, self.dist_dir).replace(os.sep, '/')
+                    base, ext = os.path.splitext(name)
+                    if ext in PRECOMPRESSED_EXTENSIONS and os.path.isfile(os.path.join(self.dist_dir, base)):
+                        continue  # attached to its source file below
+                    manifest[name] = self._build_asset(name, full_path)
+        self.manifest = manifest
+        self._prune_cache()
+
+    def _build_asset(self, name, full_path):
+        mimetype = mimetypes.guess_type(name)[0] or 'application/octet-stream'
+        is_hashed = name.startswith('assets/') and HASHED_ASSET_RE.search(name) is not None
+        asset = StaticAsset(name, mimetype, IMMUTABLE_CACHE_CONTROL if is_hashed else REVALIDATE_CACHE_CONTROL)
+
+        identity = self._load_variant(full_path, None)
+        asset.variants['identity'] = identity
+
+        for ext, encoding in PRECOMPRESSED_EXTENSIONS.items():
+            compressed_path = full_path + ext
+            if os.path.isfile(compressed_path):
+                asset.variants[encoding] = self._load_variant(compressed_path, encoding)
+
+        if mimetype.startswith(COMPRESSIBLE_TYPES):
+            for encoding in ENCODING_PREFERENCE:
+                if encoding not in asset.variants:
+                    variant = self._generate_variant(identity, encoding)
+                    if variant is not None:
+                        asset.variants[encoding] = variant
+        return asset
+
+    def _generate_variant(self, identity, encoding):
+        """Compressed copy of identity in cache_dir, or None when it would not be smaller"""
+        if encoding == 'br' and brotli is None:
+            return None
+        ext = 'br' if encoding == 'br' else 'gz'
+        path = os.path.join(self.cache_dir, f'{identity.etag}.{ext}')
+        self._cache_files.add(path)
+        if not os.path.isfile(path):
+            data = identity.data
+            if data is None:
+                with open(identity.path, 'rb') as f:
+                    data = f.read()
+            if encoding == 'br':
+                compressed = brotli.compress(data, quality=11)
+            else:
+                compressed = gzip.compress(data, compresslevel=9, mtime=0)
+            if len(compressed) >= identity.size:
+                return None
+            os.makedirs(self.cache_dir, exist_ok=True)
+            tmp_path = f'{path}.{os.getpid()}.tmp'
+            with open(tmp_path, 'wb') as f:
+                f.write(compressed)
+            os.replace(tmp_path, path)
+        return self._load_variant(path, encoding, etag=f'{identity.etag}-{encoding}')
+
+    def _prune_cache(self):
+        """Delete generated variants of files no longer in dist/"""
+        if not os.path.isdir(self.cache_dir):
+            return
+        for filename in os.listdir(self.cache_dir):
+            path = os.path.join(self.cache_dir, filename)
+            if filename.endswith(('.gz', '.br')) and path not in self._cache_files:
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+
+    def _load_variant(self, path, encoding, etag=None):
+        size = os.path.getsize(path)
+        data = None
+        digest = hashlib.sha1() if etag is None else None
+        with open(path, 'rb') as f:
+            if size <= self.max_cached_bytes:
+                data = f.read()
+                if digest:
+                    digest.update(data)
+            elif digest:
+                for chunk in iter(lambda: f.read(64 * 1024), b''):
+                    digest.update(chunk)
+        if etag is None:
+            etag = digest.hexdigest()[:20]
+            if encoding:
+                etag += '-' + encoding
+        return StaticVariant(path, size, data, etag)
+
+    def _choose_variant(self, asset, accept_encodings):
+        for encoding in ENCODING_PREFERENCE:
+            if encoding in asset.variants and accept_encodings[encoding]:
+                return encoding, asset.variants[encoding]
+        return None, asset.variants['identity']
+
+    def serve(self, path, request):
+        """Serve a file from the manifest, falling back to index.html for client-side routes"""
+        asset = self.manifest.get(path) if path else None
+        if asset is None:
+            asset = self.manifest[self.index_file]
+
+        encoding, variant = self._choose_variant(asset, request.accept_encodings)
+
+        if variant.data is not None:
+            response = Response(variant.data, mimetype=asset.mimetype)
+            response.set_etag(variant.etag)
+        else:
+            response = send_file(variant.path, mimetype=asset.mimetype, etag=variant.etag,
+                                 conditional=False, max_age=None)
+
+        if encoding:
+            response.headers['Content-Encoding'] = encoding
+        if len(asset.variants) > 1:
+            response.vary.add('Accept-Encoding')
+        response.headers['Cache-Control'] = asset.cache_control
+
+        return response.make_conditional(request)
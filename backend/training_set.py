@@ -0,0 +1,153 @@
+"""
+Bounded, de-duplicated training set.
+
+Every incoming sample is hashed over its quantized soil features and crop
+label, and a sample whose hash is already stored is dropped. Samples from
+protected sources (real agricultural data and manual entries) are always
+kept. All other samples (synthetic, sensor feeds) go into a class-stratified
+reservoir: each crop holds at most max_reservoir // number of crops samples,
+replaced by reservoir sampling (Algorithm R), so the set stays a uniform
+sample of everything ingested per crop while its size, and therefore the
+cost of a retrain, stays fixed.
+"""
+import hashlib
+import random
+import threading
+
+# Readings closer than one step are treated as the same sample
+QUANTIZATION_STEPS = {
+    'moisture': 0.5,
+    'ph': 0.05,
+    'nitrogen': 1.0,
+    'phosphorus': 0.5,
+    'potassium': 0.5
+}
+PROTECTED_SOURCES = ('real_data', 'manual')
+
+
+def sample_key(record, steps=QUANTIZATION_STEPS):
+    """Hash of a sample's quantized features and crop label"""
+    parts = [str(record.get('crop'))]
+    for feature, step in steps.items():
+        try:
+            parts.append(str(round(float(record[feature]) / step)))
+        except (KeyError, TypeError, ValueError):
+            parts.append('')
+    return hashlib.blake2b('|'.join(parts).encode(), digest_size=12).hexdigest()
+
+
+def is_protected(record):
+    return record.get('source', 'manual') in PROTECTED_SOURCES
+
+
+class TrainingSet:
+    """Protected samples plus a per-crop reservoir of the rest, without duplicates"""
+
+    def __init__(self, classes, max_reservoir, seed=None):
+        self.classes = list(classes)
+        self.max_reservoir = max(len(self.classes), int(max_reservoir))
+        self.per_class = self.max_reservoir // max(len(self.classes), 1)
+        self.records = []
+        self.index = {}      # sample key -> position in records
+        self.reservoir = {}  # crop -> positions of its reservoir samples
+        self.seen = {}       # crop -> unique unprotected samples ever offered
+        self.counters = {'added': 0, 'promoted': 0, 'duplicate': 0, 'sampled_out': 0, 'replaced': 0}
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.records)
+
+    def snapshot(self):
+        """Copy of the current samples, safe to train on while ingestion continues"""
+        with self.lock:
+            return list(self.records)
+
+    def add(self, record):
+        """Ingest one sample; returns 'added', 'promoted', 'replaced', 'duplicate' or 'sampled_out'"""
+        with self.lock:
+            outcome = self._add(record)
+            self.counters[outcome] += 1
+            return outcome
+
+    def extend(self, records):
+        """Ingest many samples; returns how many ended up with each outcome"""
+        outcomes = dict.fromkeys(self.counters, 0)
+        with self.lock:
+            for record in records:
+                outcome = self._add(record)
+                self.counters[outcome] += 1
+                outcomes[outcome] += 1
+        return outcomes
+
+    def _add(self, record):
+        key = sample_key(record)
+        crop = record.get('crop')
+        position = self.index.get(key)
+        if position is not None:
+            if is_protected(record) and not is_protected(self.records[position]):
+                # A protected copy of a reservoir sample: keep the protected
+                # one and take it out of the reservoir so it is never evicted
+                self.reservoir[self.records[position].get('crop')].remove(position)
+                self.records[position] = record
+                return 'promoted'
+            return 'duplicate'
+
+        if is_protected(record):
+            self._append(key, record)
+            return 'added'
+
+        seen = self.seen[crop] = self.seen.get(crop, 0) + 1
+        members = self.reservoir.setdefault(crop, [])
+        if len(members) < self.per_class:
+            members.append(self._append(key, record))
+            return 'added'
+
+        slot = self.rng.randrange(seen)
+        if slot >= self.per_class:
+            return 'sampled_out'
+        position = members[slot]
+        del self.index[sample_key(self.records[position])]
+        self.records[position] = record
+        self.index[key] = position
+        return 'replaced'
+
+    def _append(self, key, record):
+        self.records.append(record)
+        self.index[key] = len(self.records) - 1
+        return self.index[key]
+
+    def stats(self):
+        with self.lock:
+            reservoir_size = sum(len(members) for members in self.reservoir.values())
+            return {
+                'samples': len(self.records),
+                'protected_samples': len(self.records) - reservoir_size,
+                'reservoir_samples': reservoir_size,
+                'reservoir_capacity': self.per_class * len(self.classes),
+                'reservoir_per_class': self.per_class,
+                'seen_per_class': dict(self.seen),
+                'ingestion': dict(self.counters)
+            }
+
+    def to_state(self):
+        """Sampling state persisted next to the samples themselves"""
+        with self.lock:
+            return {'seen': dict(self.seen), 'counters': dict(self.counters)}
+
+    @classmethod
+    def load(cls, records, state, classes, max_reservoir, seed=None):
+        """
+        Rebuild from stored samples and state. Re-ingesting drops duplicates
+        and trims the reservoir if the limit was lowered; returns
+        (training set, whether any stored sample was dropped).
+        """
+        training_set = cls(classes, max_reservoir, seed)
+        outcomes = training_set.extend(records)
+        state = state or {}
+        for crop, seen in state.get('seen', {}).items():
+            training_set.seen[crop] = max(training_set.seen.get(crop, 0), int(seen))
+        training_set.counters = {name: int(state.get('counters', {}).get(name, 0)) for name in training_set.counters}
+        dropped = outcomes['promoted'] + outcomes['duplicate'] + outcomes['sampled_out'] + outcomes['replaced'] > 0
+        return training_set, dropped
+
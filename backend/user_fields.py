@@ -0,0 +1,28 @@
+"""
+Field helpers shared by the admin user indexes and the similar-farms search,
+so both read a user's crop and region the same way.
+"""
+
+
+def normalize(value):
+    """Case- and whitespace-insensitive key for a value, or None if it is empty"""
+    if value is None:
+        return None
+    value = str(value).strip().lower()
+    return value or None
+
+
+def user_region(user):
+    """
+    Region (state) of a user, from user['state'], a {'region': ...} or
+    {'state': ...} location, or a "Punjab, India" style location string
+    """
+    if user.get('state'):
+        return str(user['state']).strip() or None
+    location = user.get('location')
+    if isinstance(location, dict):
+        region = location.get('region') or location.get('state')
+        return (str(region).strip() or None) if region else None
+    if isinstance(location, str):
+        return location.split(',')[0].strip() or None
+    return None
@@ -0,0 +1,195 @@
+"""
+Secondary indexes over the users dict.
+
+Keeps a time-ordered index on trial_end_date and hash indexes on crop type,
+region, subscription tier and (crop, region), so admin queries never scan
+the full user set. Each hash bucket is a sorted list of emails, so a page
+is read straight from the cursor position. The index keys are persisted
+next to users.json together with a fingerprint of that file; on startup
+they are reloaded when the fingerprint still matches and rebuilt from the
+users otherwise.
+"""
+import bisect
+import itertools
+import json
+import os
+
+from user_fields import normalize, user_region
+
+HASH_FIELDS = ('crop', 'region', 'tier', 'crop_region')
+# Bumped whenever index_keys changes, so persisted keys are rebuilt
+KEYS_VERSION = 2
+
+
+def _date_key(value):
+    """trial_end_date as a string, so any stored value sorts against YYYY-MM-DD dates"""
+    if value is None or isinstance(value, (dict, list)):
+        return None
+    return str(value).strip() or None
+
+
+def index_keys(user):
+    """Index keys for one user record"""
+    crop = normalize(user.get('cropType'))
+    region = normalize(user_region(user))
+    return {
+        'trial_end_date': _date_key(user.get('trial_end_date')),
+        'crop': crop,
+        'region': region,
+        'tier': normalize(user.get('subscription_tier')),
+        'crop_region': f'{crop}|{region}' if crop and region else None
+    }
+
+
+def file_fingerprint(path):
+    if not os.path.exists(path):
+        return None
+    stat = os.stat(path)
+    return [stat.st_size, stat.st_mtime_ns]
+
+
+class UserIndexes:
+    """In-memory secondary indexes, kept in sync by update() / remove()"""
+
+    def __init__(self):
+        self.keys = {}
+        self.trial_end = []  # sorted (trial_end_date, email)
+        self.hash = {field: {} for field in HASH_FIELDS}  # field -> value -> sorted emails
+
+    def update(self, email, user):
+        """Re-index one user after it was created or modified"""
+        keys = index_keys(user)
+        old = self.keys.get(email)
+        if old == keys:
+            return False
+        if old is not None:
+            self._unlink(email, old)
+        self._link(email, keys)
+        self.keys[email] = keys
+        return True
+
+    def remove(self, email):
+        """Drop a deleted user from every index"""
+        old = self.keys.pop(email, None)
+        if old is None:
+            return False
+        self._unlink(email, old)
+        return True
+
+    def _link(self, email, keys):
+        if keys['trial_end_date']:
+            bisect.insort(self.trial_end, (keys['trial_end_date'], email))
+        for field in HASH_FIELDS:
+            if keys[field]:
+                bisect.insort(self.hash[field].setdefault(keys[field], []), email)
+
+    def _unlink(self, email, keys):
+        if keys['trial_end_date']:
+            entry = (keys['trial_end_date'], email)
+            i = bisect.bisect_left(self.trial_end, entry)
+            if i < len(self.trial_end) and self.trial_end[i] == entry:
+                del self.trial_end[i]
+        for field in HASH_FIELDS:
+            bucket = self.hash[field].get(keys[field])
+            if bucket is not None:
+                i = bisect.bisect_left(bucket, email)
+                if i < len(bucket) and bucket[i] == email:
+                    del bucket[i]
+                if not bucket:
+                    del self.hash[field][keys[field]]
+
+    def trial_ending(self, start, end, limit, cursor=None):
+        """
+        Emails whose trial_end_date is in [start, end] (YYYY-MM-DD strings),
+        in date order. cursor is the last (date, email) of the previous page.
+        """
+        first = bisect.bisect_left(self.trial_end, (start, ''))
+        hi = bisect.bisect_right(self.trial_end, (end, '\uffff'))
+        lo = max(first, bisect.bisect_right(self.trial_end, tuple(cursor))) if cursor else first
+        page = self.trial_end[lo:min(hi, lo + limit)]
+        next_cursor = list(page[-1]) if page and lo + limit < hi else None
+        return [email for _, email in page], next_cursor, max(0, hi - first)
+
+    def lookup(self, filters, limit, cursor=None):
+        """
+        Emails matching every field=value in filters, ordered by email.
+        cursor is the last email of the previous page.
+        """
+        buckets = []
+        for field, value in filters.items():
+            bucket = self.hash[field].get(normalize(value))
+            if not bucket:
+                return [], None, 0
+            buckets.append(bucket)
+        buckets.sort(key=len)
+        smallest, others = buckets[0], buckets[1:]
+        start = bisect.bisect_right(smallest, cursor) if cursor else 0
+
+        if not others:
+            page = smallest[start:start + limit]
+            next_cursor = page[-1] if page and start + limit < len(smallest) else None
+            return page, next_cursor, len(smallest)
+
+        # Several filters: walk the most selective bucket from the cursor and
+        # probe the others, so the cost is bounded by that bucket, not all users
+        def matches(email):
+            for bucket in others:
+                i = bisect.bisect_left(bucket, email)
+                if i == len(bucket) or bucket[i] != email:
+                    return False
+            return True
+
+        page = []
+        next_cursor = None
+        for email in itertools.islice(smallest, start, None):
+            if matches(email):
+                if len(page) == limit:
+                    next_cursor = page[-1]
+                    break
+                page.append(email)
+        total = sum(1 for email in smallest if matches(email))
+        return page, next_cursor, total
+
+    def counts(self, field):
+        """Number of users per indexed value of field"""
+        return {value: len(emails) for value, emails in self.hash[field].items()}
+
+    def _bulk_load(self, keys_by_email):
+        """Build every index in one pass, sorting the trial index once"""
+        self.__init__()
+        for email, keys in keys_by_email.items():
+            self.keys[email] = keys
+            if keys['trial_end_date']:
+                self.trial_end.append((keys['trial_end_date'], email))
+            for field in HASH_FIELDS:
+                if keys[field]:
+                    self.hash[field].setdefault(keys[field], []).append(email)
+        self.trial_end.sort()
+        for buckets in self.hash.values():
+            for bucket in buckets.values():
+                bucket.sort()
+
+    def rebuild(self, users):
+        self._bulk_load({email: index_keys(user) for email, user in users.items()})
+
+    def save(self, path, users_file):
+        """Persist index keys, tagged with the users file they describe"""
+        with open(path, 'w') as f:
+            json.dump({'version': KEYS_VERSION, 'users_fingerprint': file_fingerprint(users_file),
+                       'keys': self.keys}, f)
+
+    def load(self, path, users_file, users):
+        """Load persisted keys if they still match users_file, otherwise rebuild"""
+        fingerprint = file_fingerprint(users_file)
+        if os.path.exists(path):
+            try:
+                with open(path, 'r') as f:
+                    stored = json.load(f)
+                if (stored.get('version') == KEYS_VERSION and stored.get('users_fingerprint') == fingerprint
+                        and stored['keys'].keys() == users.keys()):
+                    self._bulk_load(stored['keys'])
+                    return True
+            except (ValueError, KeyError, TypeError, AttributeError):
+                pass
+        self.rebuild(users)
+        return False